@@ -22,6 +22,11 @@ app.register_blueprint(api_bp)
 app.register_blueprint(reports_bp)
 app.register_blueprint(blacklist_bp)
 
+# Cortes automáticos del informe: un hilo por worker (también tras un fork)
+from services import report_scheduler
+report_scheduler.start()
+app.before_request(report_scheduler.start)
+
 @app.route("/")
 def index():
     return render_template("dashboard.html")
@@ -35,21 +40,29 @@ def analyze_legacy():
     from flask import request as req
     from data_sources.metabase_client import fetch_orders
     from services.leveling_engine import run_leveling
+    from config import INCREMENTAL_LEVELING, PARALLEL_LEVELING
+    spool, cache_hit = None, False
     try:
         if "file" in req.files:
-            from data_sources.excel_loader import load_from_bytes
+            from data_sources.excel_loader import iter_orders, spool_upload
+            from data_sources import upload_cache, parser_for
             f = req.files["file"]
-            orders = load_from_bytes(f.read(), f.filename)
+            parse = parser_for(f.filename)[0] or iter_orders
+            spool, digest = spool_upload(f.stream)
+            orders, cache_hit = upload_cache.load_upload(spool, digest, f.filename, parse)
         else:
             fecha = req.form.get("fecha")
             zona  = req.form.get("zona")
             cat   = req.form.get("cat")
             orders = fetch_orders(fecha=fecha, zona=zona, cat=cat)
-        result = run_leveling(orders)
-        return jsonify({"status":"ok","message":f"Nivela completada. {result['resumen']['total_ordenes']} ordenes procesadas.","data_url":"/api/nivelacion","dashboard":"/",**result})
+        result = run_leveling(orders, incremental=INCREMENTAL_LEVELING,
+                              parallel=PARALLEL_LEVELING)
+        return jsonify({"status":"ok","message":f"Nivela completada. {result['resumen']['total_ordenes']} ordenes procesadas.","data_url":"/api/nivelacion","dashboard":"/","cache_hit":cache_hit,**result})
     except Exception as e:
         logger.exception("Error en /analyze legacy")
         return jsonify({"status":"error","message":str(e)}), 500
+    finally:
+        if spool is not None: spool.close()
 
 @app.errorhandler(404)
 def not_found(e):
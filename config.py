@@ -2,6 +2,7 @@
 config.py - Configuracion central de Nivelacion Pro Web
 """
 import os
+import tempfile
 from datetime import datetime
 
 try:
@@ -221,4 +222,45 @@ ZONE_ADJACENCY = {
 
 DATA_CACHE_TTL = int(os.environ.get("DATA_CACHE_TTL", "300"))
 
+# Nivelación incremental: reutiliza la ejecución anterior para filas sin cambios
+INCREMENTAL_LEVELING = os.environ.get("INCREMENTAL_LEVELING", "true").lower() == "true"
+
+# Sugerencias en paralelo por grupo de zonas conexas de ZONE_ADJACENCY (opcional).
+# Los movimientos entre grupos distintos no se evalúan en este modo.
+PARALLEL_LEVELING         = os.environ.get("PARALLEL_LEVELING", "false").lower() == "true"
+PARALLEL_LEVELING_WORKERS = int(os.environ.get("PARALLEL_LEVELING_WORKERS", "0"))  # 0 = un proceso por núcleo
+
+# Uploads: hasta este tamaño el archivo se mantiene en memoria; más grande se
+# desborda a un temporal en disco (SpooledTemporaryFile)
+UPLOAD_SPOOL_MAX_BYTES = int(os.environ.get("UPLOAD_SPOOL_MAX_BYTES", str(4 * 1024 * 1024)))
+
+# Caché de uploads parseados (por SHA-256 del archivo): topes de archivos y filas
+UPLOAD_CACHE_MAX_ENTRIES = int(os.environ.get("UPLOAD_CACHE_MAX_ENTRIES", "4"))
+UPLOAD_CACHE_MAX_ROWS    = int(os.environ.get("UPLOAD_CACHE_MAX_ROWS",    "60000"))
+
+# Estado compartido entre workers de gunicorn (services/state_store.py):
+# "sqlite" (archivo en modo WAL, compartido por todos los procesos) o "memory"
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "sqlite").lower()
+STATE_DB_PATH = os.environ.get(
+    "STATE_DB_PATH", os.path.join(tempfile.gettempdir(), "nivelacion_pro_state.sqlite3"))
+
+# /api/stream (SSE): cada conexión ocupa un hilo del worker mientras dura, así
+# que el tope por worker debe quedar por debajo de --threads (Procfile).
+# Duración máxima (el navegador reconecta solo) y cada cuánto va un keep-alive
+STREAM_MAX_CLIENTS       = int(os.environ.get("STREAM_MAX_CLIENTS",       "8"))
+STREAM_MAX_SECONDS       = int(os.environ.get("STREAM_MAX_SECONDS",       "300"))
+STREAM_KEEPALIVE_SECONDS = int(os.environ.get("STREAM_KEEPALIVE_SECONDS", "15"))
+
+# Archivo de días cerrados del informe diario (/api/reports/range): días que se conservan
+REPORT_ARCHIVE_DAYS = int(os.environ.get("REPORT_ARCHIVE_DAYS", "120"))
+
+# Cortes automáticos del informe diario (services/report_scheduler.py).
+# REPORT_CUT_TIMES: "HH:MM,HH:MM,..." (vacío = inicio de cada franja de FRANJAS).
+# REPORT_CLOSING_CUT: corte de cierre (vacío = fin de la última franja, "none" = sin cierre).
+# Un horario se dispara solo dentro de los REPORT_CUT_GRACE_MINUTES siguientes (sin pasar de las 23:59).
+REPORT_AUTO_CUTS          = os.environ.get("REPORT_AUTO_CUTS", "true").lower() == "true"
+REPORT_CUT_TIMES          = [t.strip() for t in os.environ.get("REPORT_CUT_TIMES", "").split(",") if t.strip()]
+REPORT_CLOSING_CUT        = os.environ.get("REPORT_CLOSING_CUT", "").strip()
+REPORT_CUT_GRACE_MINUTES  = int(os.environ.get("REPORT_CUT_GRACE_MINUTES", "20"))
+
 SHEETS_WEBAPP_URL = os.environ.get("SHEETS_WEBAPP_URL", "")
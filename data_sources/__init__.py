@@ -0,0 +1,20 @@
+"""data_sources - Loaders de órdenes por formato de archivo."""
+import os
+
+
+def parser_for(filename):
+    """
+    (parser, fuente) según la extensión del archivo; parser(fileobj, filename)
+    entrega las órdenes una a una. (None, None) si el formato no se soporta.
+    """
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".xlsx":
+        from data_sources.excel_loader import iter_orders
+        return iter_orders, "excel"
+    if ext == ".csv":
+        from data_sources.text_loader import iter_csv_orders
+        return iter_csv_orders, "csv"
+    if ext in (".ndjson", ".jsonl"):
+        from data_sources.text_loader import iter_ndjson_orders
+        return iter_ndjson_orders, "ndjson"
+    return None, None
@@ -2,7 +2,9 @@
 data_sources/excel_loader.py
 Carga ordenes desde Excel. Columnas del export real Metabase #26359.
 """
-import io, re, logging
+import io, re, hashlib, tempfile, logging
+from services.normalization import compile_header
+from config import UPLOAD_SPOOL_MAX_BYTES
 logger = logging.getLogger(__name__)
 
 _ALIASES = {
@@ -19,14 +21,17 @@ _ALIASES = {
     "lat":       ["Latitude","lat","latitud"],
     "lon":       ["Longitude","lon","longitud"],
     "updated_at":["onsite_at_cot","Updated At","updated_at","fecha"],
-    "site":      ["Sites","site","edificio"],
+    "sites":     ["Sites","site","edificio"],
 }
 
-def _find(hl, aliases):
-    for a in aliases:
-        try: return hl.index(a.lower())
-        except ValueError: pass
-    return -1
+def _txt(v, default=""):
+    if v is None: return default
+    s = str(v).strip()
+    return "" if s.lower() == "none" else s
+
+def _num(v):
+    try: return float(v) if v not in (None, "", "None") else 0.0
+    except: return 0.0
 
 def _coords(text):
     if not text: return 0.0, 0.0
@@ -39,64 +44,87 @@ def _coords(text):
             except: pass
     return 0.0, 0.0
 
+def build_order(values, n, source):
+    """
+    Orden en el esquema interno a partir de la tupla de compile_header(…, _ALIASES).
+    n es la posición de la fila (id de respaldo); source queda en "_source".
+    """
+    (raw_id, tecnico, estado, franja, tipo, zona, ciudad, subzona,
+     direccion, gmaps, lat, lon, updated_at, sites) = values
+    raw_id = _txt(raw_id)
+    if raw_id.endswith(".0"): raw_id = raw_id[:-2]
+    order_id = raw_id or f"row_{n}"
+    gmaps = _txt(gmaps)
+    lat, lon = _num(lat), _num(lon)
+    if not lat and not lon: lat, lon = _coords(gmaps)
+    zona = _txt(zona).strip()
+    ciudad = _txt(ciudad).strip()
+    # Fallback: si zona está vacía, usar Cities__name como zona
+    if not zona or zona.lower() in ("none", "nan", ""):
+        zona = ciudad if ciudad and ciudad.lower() not in ("none", "nan", "") else "SIN_ZONA"
+    zona = zona.upper()
+    return {
+        "id":        order_id,
+        "tecnico":   _txt(tecnico,   "SIN_ASIGNAR"),
+        "estado":    _txt(estado,    "por programar").lower(),
+        "franja":    _txt(franja,    "Sin Franja"),
+        "tipo":      _txt(tipo,      "instalacion").lower(),
+        "zona":      zona,
+        "ciudad":    ciudad.upper() if ciudad else zona,
+        "subzona":   _txt(subzona,   "SIN_SUBZONA").upper() or "SIN_SUBZONA",
+        "sites":     _txt(sites),
+        "direccion": _txt(direccion),
+        "gmaps":     gmaps,
+        "lat":       lat,
+        "lon":       lon,
+        "updated_at":_txt(updated_at),
+        "_source":   source,
+        "_mapped":   True,
+    }
+
+def spool_upload(stream, max_size=UPLOAD_SPOOL_MAX_BYTES):
+    """
+    Copia el stream del upload por bloques a un SpooledTemporaryFile (memoria
+    hasta max_size, disco después) y lo deja posicionado al inicio.
+    Retorna (spool, sha256 hex de los bytes) — el digest indexa upload_cache.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk: break
+        digest.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return spool, digest.hexdigest()
+
 def load_from_bytes(file_bytes, filename=""):
+    return list(iter_orders(io.BytesIO(file_bytes), filename))
+
+def iter_orders(fileobj, filename=""):
+    """
+    Generador de órdenes desde un Excel (archivo o file-like con seek).
+    openpyxl en modo read-only entrega las filas de a una: ninguna lista
+    intermedia de filas crudas se materializa.
+    """
     try: import openpyxl
     except ImportError: raise RuntimeError("openpyxl no instalado")
-    wb = openpyxl.load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
-    ws = wb.active
-    rows_iter = ws.iter_rows(values_only=True)
-    header_row = next(rows_iter, None)
-    if not header_row: return []
-    hl = [str(h).strip().lower() if h is not None else "" for h in header_row]
-    col = {field: _find(hl, aliases) for field, aliases in _ALIASES.items()}
-    found = {f: header_row[i] for f,i in col.items() if i>=0}
-    logger.info(f"Excel columnas mapeadas: {found}")
-    orders = []
-    for row in rows_iter:
-        if not any(v is not None for v in row): continue
-        def g(field, default=""):
-            i = col.get(field, -1)
-            if i < 0 or i >= len(row): return default
-            v = row[i]
-            if v is None: return default
-            s = str(v).strip()
-            return "" if s.lower() == "none" else s
-        def gf(field):
-            try:
-                i = col.get(field, -1)
-                if i < 0 or i >= len(row): return 0.0
-                v = row[i]
-                return float(v) if v not in (None, "", "None") else 0.0
-            except: return 0.0
-        raw_id = g("id")
-        if raw_id.endswith(".0"): raw_id = raw_id[:-2]
-        order_id = raw_id or f"row_{len(orders)}"
-        lat, lon = gf("lat"), gf("lon")
-        if not lat and not lon: lat, lon = _coords(g("gmaps"))
-        zona = g("zona", "").strip()
-        ciudad = g("ciudad", "").strip()
-        # Fallback: si zona está vacía, usar Cities__name como zona
-        if not zona or zona.lower() in ("none", "nan", ""):
-            zona = ciudad if ciudad and ciudad.lower() not in ("none", "nan", "") else "SIN_ZONA"
-        zona = zona.upper()
-        estado = g("estado", "por programar").lower()
-        orders.append({
-            "id":        order_id,
-            "tecnico":   g("tecnico",   "SIN_ASIGNAR"),
-            "estado":    estado,
-            "franja":    g("franja",    "Sin Franja"),
-            "tipo":      g("tipo",      "instalacion").lower(),
-            "zona":      zona,
-            "ciudad":    ciudad.upper() if ciudad else zona,
-            "subzona":   g("subzona",   "SIN_SUBZONA").upper() or "SIN_SUBZONA",
-            "site":      g("site",      ""),
-            "direccion": g("direccion", ""),
-            "gmaps":     g("gmaps",     ""),
-            "lat":       lat,
-            "lon":       lon,
-            "updated_at":g("updated_at",""),
-            "_source":   "excel",
-        })
-    wb.close()
-    logger.info(f"Excel '{filename}': {len(orders)} ordenes")
-    return orders
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        rows_iter = ws.iter_rows(values_only=True)
+        header_row = next(rows_iter, None)
+        if not header_row: return
+        # Header compilado una vez: cada fila se extrae por posición ya en el
+        # esquema interno (orden de _ALIASES) y normalize_order no repite alias
+        _, col, extract = compile_header(header_row, _ALIASES)
+        found = {f: header_row[i] for f,i in col.items()}
+        logger.info(f"Excel columnas mapeadas: {found}")
+        n = 0
+        for row in rows_iter:
+            if not any(v is not None for v in row): continue
+            yield build_order(extract(row), n, "excel")
+            n += 1
+        logger.info(f"Excel '{filename}': {n} ordenes")
+    finally:
+        wb.close()
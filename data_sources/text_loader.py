@@ -0,0 +1,64 @@
+"""
+data_sources/text_loader.py
+Carga ordenes desde CSV (export directo de Metabase) y NDJSON, fila a fila,
+con el mismo mapeo de columnas que excel_loader._ALIASES.
+"""
+import io, csv, json, logging
+from services.normalization import compile_header
+from data_sources.excel_loader import _ALIASES, build_order
+
+logger = logging.getLogger(__name__)
+
+
+def iter_csv_orders(fileobj, filename=""):
+    """
+    Generador de órdenes desde un CSV binario (UTF-8, con o sin BOM).
+    El separador se detecta sobre la primera línea (coma, punto y coma o tab).
+    Las celdas vacías se tratan como ausentes, igual que en Excel.
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        first = text.readline()
+        if not first.strip(): return
+        try: dialect = csv.Sniffer().sniff(first, delimiters=",;\t")
+        except csv.Error: dialect = csv.excel
+        header_row = next(csv.reader([first], dialect))
+        _, col, extract = compile_header(header_row, _ALIASES)
+        found = {f: header_row[i] for f,i in col.items()}
+        logger.info(f"CSV columnas mapeadas: {found}")
+        n = 0
+        for row in csv.reader(text, dialect):
+            row = [v if v != "" else None for v in row]
+            if not any(v is not None for v in row): continue
+            yield build_order(extract(row), n, "csv")
+            n += 1
+        logger.info(f"CSV '{filename}': {n} ordenes")
+    finally:
+        text.detach()
+
+
+def iter_ndjson_orders(fileobj, filename=""):
+    """
+    Generador de órdenes desde NDJSON: un objeto JSON por línea. El mapeo de
+    columnas se compila una vez por conjunto de keys distinto.
+    """
+    schemas = {}
+    n = 0
+    for lineno, line in enumerate(fileobj, 1):
+        line = line.strip()
+        if not line: continue
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            raise ValueError(f"NDJSON inválido en línea {lineno}")
+        if not isinstance(obj, dict):
+            raise ValueError(f"NDJSON inválido en línea {lineno}: se esperaba un objeto")
+        keys = tuple(obj)
+        extract = schemas.get(keys)
+        if extract is None:
+            extract = schemas[keys] = compile_header(keys, _ALIASES)[2]
+        row = [v if v != "" else None for v in obj.values()]
+        if not any(v is not None for v in row): continue
+        yield build_order(extract(row), n, "ndjson")
+        n += 1
+    logger.info(f"NDJSON '{filename}': {n} ordenes")
@@ -0,0 +1,79 @@
+"""
+data_sources/upload_cache.py
+Caché LRU de uploads ya parseados, indexado por el SHA-256 de los bytes.
+Un mismo export subido dos veces no vuelve a pasar por el parser.
+"""
+import threading, logging
+from collections import OrderedDict
+from config import UPLOAD_CACHE_MAX_ENTRIES, UPLOAD_CACHE_MAX_ROWS
+
+logger = logging.getLogger(__name__)
+
+_pc = {"entries": OrderedDict(), "rows": 0, "hits": 0, "misses": 0}
+_lock = threading.Lock()
+
+
+def get(digest):
+    """Órdenes parseadas del archivo con ese digest, o None si no está en caché."""
+    with _lock:
+        orders = _pc["entries"].get(digest)
+        if orders is None:
+            _pc["misses"] += 1
+            return None
+        _pc["entries"].move_to_end(digest)
+        _pc["hits"] += 1
+        return orders
+
+
+def put(digest, orders):
+    """Guarda las órdenes y expulsa las entradas menos usadas hasta respetar los topes."""
+    if len(orders) > UPLOAD_CACHE_MAX_ROWS:
+        return
+    with _lock:
+        old = _pc["entries"].pop(digest, None)
+        if old is not None:
+            _pc["rows"] -= len(old)
+        _pc["entries"][digest] = orders
+        _pc["rows"] += len(orders)
+        while (len(_pc["entries"]) > UPLOAD_CACHE_MAX_ENTRIES
+               or _pc["rows"] > UPLOAD_CACHE_MAX_ROWS):
+            _, evicted = _pc["entries"].popitem(last=False)
+            _pc["rows"] -= len(evicted)
+
+
+def _tee(digest, rows):
+    """Entrega las filas del parser y, si se consumen completas, las deja en caché."""
+    kept = []
+    for row in rows:
+        if kept is not None:
+            kept.append(row)
+            if len(kept) > UPLOAD_CACHE_MAX_ROWS:
+                kept = None   # archivo demasiado grande para cachear
+        yield row
+    if kept is not None:
+        put(digest, kept)
+
+
+def load_upload(spool, digest, filename, parse):
+    """
+    Órdenes de un upload ya spooleado: del caché si el digest ya se vio,
+    si no parse(spool, filename) con copia al caché.
+    Retorna (orders, cache_hit).
+    """
+    orders = get(digest)
+    if orders is not None:
+        logger.info(f"Upload '{filename}': caché ({len(orders)} ordenes)")
+        return orders, True
+    return _tee(digest, parse(spool, filename)), False
+
+
+def cache_info():
+    with _lock:
+        return {
+            "entries":     len(_pc["entries"]),
+            "rows":        _pc["rows"],
+            "hits":        _pc["hits"],
+            "misses":      _pc["misses"],
+            "max_entries": UPLOAD_CACHE_MAX_ENTRIES,
+            "max_rows":    UPLOAD_CACHE_MAX_ROWS,
+        }
@@ -4,61 +4,283 @@ Todos los endpoints JSON de la plataforma de nivelación.
 Sin generación de Excel como flujo principal.
 """
 import logging
-from flask import Blueprint, jsonify, request
+import threading
+import time
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from data_sources.metabase_client import fetch_orders, invalidate_cache, cache_info
-from data_sources.excel_loader import load_from_bytes
+from data_sources.excel_loader import spool_upload
+from data_sources import upload_cache, parser_for
 from services.leveling_engine import run_leveling
+from services import recompute_worker, result_delta, result_index
+from services.state_store import get_store
+from config import (INCREMENTAL_LEVELING, PARALLEL_LEVELING, STREAM_MAX_CLIENTS,
+                    STREAM_MAX_SECONDS, STREAM_KEEPALIVE_SECONDS)
+from routes.http_cache import cached_json
 
 logger = logging.getLogger(__name__)
 api_bp = Blueprint("api", __name__, url_prefix="/api")
 
-# Estado de sesión en memoria (historial de sugerencias aplicadas)
-_session_state = {
-    "applied":   [],   # sugerencias marcadas como aplicadas
-    "dismissed": [],   # sugerencias descartadas
-    "last_result": None,
-}
+# Acciones de sesión sobre sugerencias, intercambios y rutas, compartidas entre
+# workers por services.state_store e indexadas por id de acción
+# (services.result_index.action_id):
+#   {"acciones": {id: {"estado": "aplicada"|"descartada", "tipo", "item"}},
+#    "conteo":   {"aplicada": n, "descartada": n}}
+# Su versión en el almacén versiona las respuestas de /api/sugerencias.
+_ACCIONES_KEY = "acciones"
+_ESTADO_ACCION = {"aplicar": "aplicada", "descartar": "descartada", "revertir": None}
+_MAX_ACCIONES_LOTE = 500
+# El resultado vigente (last_result) lo publica services.recompute_worker
+
+
+def _acciones_vacias() -> dict:
+    return {"acciones": {}, "conteo": {"aplicada": 0, "descartada": 0}}
+
+
+def _acciones() -> tuple:
+    """(estado de acciones, versión) desde el almacén compartido."""
+    state, version = get_store().get_versioned(_ACCIONES_KEY, None)
+    return state or _acciones_vacias(), version
+
+
+def _resolver_accion(spec, cur: dict) -> tuple:
+    """
+    (op, None) con op = (id, tipo, elemento, accion), o (None, (mensaje, status)).
+    spec: {"id"} o {"orden"} (sugerencia) o {"orden", "orden_b"} (intercambio), y "accion".
+    """
+    if not isinstance(spec, dict):
+        return None, ("Cada acción debe ser un objeto", 400)
+    accion = spec.get("accion")
+    orden, orden_b = spec.get("orden"), spec.get("orden_b")
+    accion_id = spec.get("id") or (f"INT_{orden}_{orden_b}" if orden and orden_b else orden)
+    if not accion_id or accion not in _ESTADO_ACCION:
+        return None, ("orden (o id) y accion requeridos (aplicar|descartar|revertir)", 400)
+    tipo, item = result_index.find_action(cur["result"], cur["version"], str(accion_id))
+    if item is None:
+        return None, (f"No se encontró {tipo} {accion_id}", 404)
+    return (str(accion_id), tipo, item, accion), None
+
+
+def _registrar_acciones(state, ops: list) -> dict:
+    state = state or _acciones_vacias()
+    acciones, conteo = state["acciones"], state["conteo"]
+    for accion_id, tipo, item, accion in ops:
+        previo = acciones.pop(accion_id, None)
+        if previo:
+            conteo[previo["estado"]] -= 1
+        estado = _ESTADO_ACCION[accion]
+        if estado:
+            acciones[accion_id] = {"estado": estado, "tipo": tipo, "item": item}
+            conteo[estado] += 1
+    return state
+
+
+def _recalcular():
+    """Job de recálculo desde la fuente de datos (Metabase / caché de datos)."""
+    return run_leveling(fetch_orders(force=True), incremental=INCREMENTAL_LEVELING,
+                        parallel=PARALLEL_LEVELING)
+
+
+def _current(force: bool = False) -> dict:
+    """
+    Resultado vigente con sus metadatos (recompute_worker.current()).
+    force=True encola un recálculo y devuelve de inmediato el actual, marcado stale.
+    Solo si todavía no existe ningún resultado se espera al recálculo.
+    """
+    if force:
+        recompute_worker.submit(_recalcular, "refresh", coalesce=True)
+    return recompute_worker.ensure(_recalcular)
 
 
 def _get_result(force: bool = False):
-    """Obtiene o recalcula el resultado de nivelación."""
-    if force or _session_state["last_result"] is None:
-        orders = fetch_orders(force=force)
-        result = run_leveling(orders)
-        _session_state["last_result"] = result
-    return _session_state["last_result"]
+    """Obtiene el resultado de nivelación vigente."""
+    return _current(force)["result"]
+
+
+def _result_response(cur: dict, build, *version_extra, volatile: bool = False):
+    """
+    cached_json de una vista del resultado vigente. La versión incluye el job
+    pendiente (stale) y version_extra; X-Result-Stale / X-Result-Age informan
+    si hay un recálculo en curso y la edad del resultado servido.
+    """
+    headers = {"X-Result-Stale": "true" if cur["stale"] else "false"}
+    if cur["edad_s"] is not None:
+        headers["X-Result-Age"] = str(int(cur["edad_s"]))
+    version = None if volatile else (cur["version"], cur["job_id"], *version_extra)
+    return cached_json(version, build, cur["modified"], headers)
 
 
 # ─── /api/nivelacion ─────────────────────────
 
+def _lista_param(args, name: str) -> list:
+    """Valores de un parámetro repetible y/o separado por comas."""
+    return [v.strip() for raw in args.getlist(name) for v in raw.split(",") if v.strip()]
+
+
+def _int_param(args, name: str):
+    raw = args.get(name)
+    if raw in (None, ""):
+        return None
+    value = int(raw)
+    if value < 0:
+        raise ValueError
+    return value
+
+
+def _vista_ordenes(args):
+    """
+    Parámetros de vista de /api/nivelacion, o None si no viene ninguno.
+    ValueError si limit/offset no son enteros >= 0.
+    """
+    filtros = {campo: _lista_param(args, campo) for campo in result_index.INDEXED}
+    vista = {
+        "filtros":   {c: v for c, v in filtros.items() if v},
+        "fields":    _lista_param(args, "fields"),
+        "secciones": _lista_param(args, "secciones"),
+        "offset":    _int_param(args, "offset"),
+        "limit":     _int_param(args, "limit"),
+    }
+    return vista if any(v not in (None, [], {}) for v in vista.values()) else None
+
+
 @api_bp.get("/nivelacion")
 def get_nivelacion():
     """
     Devuelve el resultado completo de nivelación:
     resumen, carga, órdenes, alertas y sugerencias.
+
+    Vista parcial (opcional, p. ej. un técnico desde el celular):
+      tecnico= zona= franja=  filtran ordenes_movibles / ordenes_bloqueadas
+                              (repetibles o separados por coma; sin distinguir
+                              mayúsculas). Se resuelven con índices del resultado.
+      fields=id,estado,...    proyección de cada orden ("id" siempre va)
+      offset= limit=          página de cada lista; "paginacion" trae los totales
+      secciones=resumen,...   solo esas secciones del resultado (las perezosas
+                              que no se pidan no se calculan)
     """
+    try:
+        vista = _vista_ordenes(request.args)
+    except ValueError:
+        return jsonify({"status": "error", "message": "offset y limit deben ser enteros >= 0"}), 400
     try:
         force = request.args.get("refresh", "false").lower() == "true"
-        result = _get_result(force=force)
-        return jsonify({"status": "ok", **result})
+        cur = _current(force=force)
+        result = cur["result"]
+        if vista is None:
+            return _result_response(cur, lambda: {
+                "status": "ok", **result, "resultado_id": cur["result_id"],
+                "stale": cur["stale"], "recalculando": cur["job_id"],
+            })
+
+        def build():
+            keys = [k for k in result.keys() if not vista["secciones"] or k in vista["secciones"]]
+            fields = ["id"] + [f for f in vista["fields"] if f != "id"] if vista["fields"] else None
+            payload = {"status": "ok"}
+            paginacion = {"offset": vista["offset"] or 0, "limit": vista["limit"]}
+            for key in keys:
+                if key in result_index.ORDER_LISTS:
+                    payload[key], paginacion[f"total_{key}"] = result_index.query(
+                        result, cur["version"], key, vista["filtros"],
+                        vista["offset"] or 0, vista["limit"], fields,
+                    )
+                else:
+                    payload[key] = result.get(key)
+            payload.update({
+                "paginacion": paginacion, "resultado_id": cur["result_id"],
+                "stale": cur["stale"], "recalculando": cur["job_id"],
+            })
+            return payload
+        return _result_response(cur, build)
     except Exception as e:
         logger.exception("Error en /api/nivelacion")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+# ─── /api/stream (SSE) ───────────────────────
+
+_stream_slots = threading.BoundedSemaphore(STREAM_MAX_CLIENTS)
+_STREAM_POLL_S = 1.0   # cada cuánto cada conexión revisa resultado y recálculos
+
+
+def _sse(event: str, data, event_id: str = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + current_app.json.dumps(data))
+    return "\n".join(lines) + "\n\n"
+
+
+@api_bp.get("/stream")
+def get_stream():
+    """
+    Server-Sent Events con los cambios del resultado vigente.
+      delta  {desde, hasta, generado_en, secciones}: lo que cambió respecto al
+             resultado anterior (ver services/result_delta.py). id = resultado_id.
+      estado {stale, recalculando}: empezó o terminó un recálculo.
+      full   {resultado_id}: el cliente no tiene un resultado base conocido
+             (desde / Last-Event-ID) y debe recargar /api/nivelacion.
+    La conexión se cierra a los STREAM_MAX_SECONDS; el navegador reconecta
+    enviando Last-Event-ID y recibe solo lo que le falte.
+    """
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({"status": "error", "message": "Demasiadas conexiones de stream"}), 503
+    desde = request.headers.get("Last-Event-ID") or request.args.get("desde")
+
+    def eventos():
+        yield "retry: 3000\n\n"
+        enviado = recompute_worker.current()
+        if enviado["result_id"] != desde:
+            yield _sse("full", {"resultado_id": enviado["result_id"]}, enviado["result_id"])
+        estado = (enviado["stale"], enviado["job_id"])
+        ultimo = inicio = time.monotonic()
+        while time.monotonic() - inicio < STREAM_MAX_SECONDS:
+            cur = recompute_worker.wait_change(enviado["version"], _STREAM_POLL_S)
+            salida = []
+            if cur["version"] != enviado["version"]:
+                if enviado["result"] is None:
+                    salida.append(_sse("full", {"resultado_id": cur["result_id"]}, cur["result_id"]))
+                else:
+                    salida.append(_sse("delta", result_delta.delta(
+                        enviado["result_id"], enviado["result"], cur["result_id"], cur["result"],
+                    ), cur["result_id"]))
+                enviado = cur
+            if (cur["stale"], cur["job_id"]) != estado:
+                estado = (cur["stale"], cur["job_id"])
+                salida.append(_sse("estado", {"stale": cur["stale"], "recalculando": cur["job_id"]}))
+            if not salida and time.monotonic() - ultimo >= STREAM_KEEPALIVE_SECONDS:
+                salida.append(": keep-alive\n\n")
+            if salida:
+                ultimo = time.monotonic()
+                yield "".join(salida)
+
+    resp = Response(stream_with_context(eventos()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Libera el cupo al cerrar la respuesta (también si el cliente se va antes de empezar)
+    resp.call_on_close(_stream_slots.release)
+    return resp
+
+
 # ─── /api/resumen ────────────────────────────
 
 @api_bp.get("/resumen")
 def get_resumen():
-    """Devuelve solo el resumen ejecutivo."""
+    """
+    Devuelve solo el resumen ejecutivo, completo (todos los conteos son
+    enteros). Las secciones de las que salen los conteos las calcula el
+    recompute_worker apenas publica el resultado; si el request llega antes,
+    espera ese cálculo.
+    """
     try:
-        result = _get_result()
-        return jsonify({
+        cur = _current()
+        result = cur["result"]
+        resumen = result.get("resumen", {})
+        # cache_info() cambia con el tiempo: se serializa siempre, el ETag decide el 304
+        return _result_response(cur, lambda: {
             "status":      "ok",
             "generado_en": result.get("generado_en"),
-            "resumen":     result.get("resumen", {}),
+            "resumen":     dict(resumen.items()),
             "cache":       cache_info(),
-        })
+            "stale":       cur["stale"],
+        }, volatile=True)
     except Exception as e:
         logger.exception("Error en /api/resumen")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -70,16 +292,20 @@ def get_resumen():
 def get_alertas():
     """Devuelve la lista de alertas activas con severidad."""
     try:
-        result = _get_result()
-        alertas = result.get("alertas", [])
-        severidad = request.args.get("severidad")  # critica | alta | media
-        if severidad:
-            alertas = [a for a in alertas if a.get("severidad") == severidad]
-        return jsonify({
-            "status":  "ok",
-            "total":   len(alertas),
-            "alertas": alertas,
-        })
+        cur = _current()
+        result = cur["result"]
+
+        def build():
+            alertas = result.get("alertas", [])
+            severidad = request.args.get("severidad")  # critica | alta | media
+            if severidad:
+                alertas = [a for a in alertas if a.get("severidad") == severidad]
+            return {
+                "status":  "ok",
+                "total":   len(alertas),
+                "alertas": alertas,
+            }
+        return _result_response(cur, build)
     except Exception as e:
         logger.exception("Error en /api/alertas")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -91,29 +317,30 @@ def get_alertas():
 def get_sugerencias():
     """Devuelve sugerencias de nivelación, filtradas por estado de sesión."""
     try:
-        result = _get_result()
-        sugerencias = result.get("sugerencias", [])
-
-        # Excluir aplicadas/descartadas en esta sesión
-        applied_ids   = {s["orden"] for s in _session_state["applied"]}
-        dismissed_ids = {s["orden"] for s in _session_state["dismissed"]}
-
-        activas = [
-            {**s, "session_status": "aplicada" if s["orden"] in applied_ids
-                                    else "descartada" if s["orden"] in dismissed_ids
-                                    else "pendiente"}
-            for s in sugerencias
-        ]
-
-        mostrar = request.args.get("estado", "pendiente")
-        if mostrar != "todas":
-            activas = [s for s in activas if s["session_status"] == mostrar]
-
-        return jsonify({
-            "status":     "ok",
-            "total":      len(activas),
-            "sugerencias": activas,
-        })
+        cur = _current()
+        result = cur["result"]
+        acciones, acciones_version = _acciones()
+
+        def build():
+            sugerencias = result.get("sugerencias", [])
+
+            # Estado de sesión de cada sugerencia: búsqueda directa por id
+            estados = acciones["acciones"]
+            activas = [
+                {**s, "session_status": (estados.get(str(s["orden"])) or {}).get("estado", "pendiente")}
+                for s in sugerencias
+            ]
+
+            mostrar = request.args.get("estado", "pendiente")
+            if mostrar != "todas":
+                activas = [s for s in activas if s["session_status"] == mostrar]
+
+            return {
+                "status":     "ok",
+                "total":      len(activas),
+                "sugerencias": activas,
+            }
+        return _result_response(cur, build, acciones_version)
     except Exception as e:
         logger.exception("Error en /api/sugerencias")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -122,40 +349,66 @@ def get_sugerencias():
 @api_bp.post("/sugerencias/accion")
 def post_sugerencia_accion():
     """
-    Registra una acción sobre una sugerencia (aplicar/descartar/revertir).
-    Solo persiste en sesión (memoria). No modifica Metabase.
+    Registra una acción sobre una sugerencia, intercambio o ruta
+    (aplicar/descartar/revertir).
+    Solo persiste en el estado de sesión compartido. No modifica Metabase.
     Body: {"orden": "id_orden", "accion": "aplicar"|"descartar"|"revertir"}
+          intercambio: {"orden", "orden_b", "accion"}; o {"id", "accion"}
     """
-    body = request.get_json(silent=True) or {}
-    orden  = body.get("orden")
-    accion = body.get("accion")
-
-    if not orden or accion not in ("aplicar", "descartar", "revertir"):
-        return jsonify({"status": "error", "message": "orden y accion requeridos (aplicar|descartar|revertir)"}), 400
-
-    result = _get_result()
-    sugerencia = next((s for s in result.get("sugerencias", []) if s["orden"] == orden), None)
-    if not sugerencia:
-        return jsonify({"status": "error", "message": f"No se encontró sugerencia para orden {orden}"}), 404
-
-    if accion == "aplicar":
-        _session_state["dismissed"] = [s for s in _session_state["dismissed"] if s["orden"] != orden]
-        if not any(s["orden"] == orden for s in _session_state["applied"]):
-            _session_state["applied"].append(sugerencia)
-    elif accion == "descartar":
-        _session_state["applied"] = [s for s in _session_state["applied"] if s["orden"] != orden]
-        if not any(s["orden"] == orden for s in _session_state["dismissed"]):
-            _session_state["dismissed"].append(sugerencia)
-    elif accion == "revertir":
-        _session_state["applied"]   = [s for s in _session_state["applied"]   if s["orden"] != orden]
-        _session_state["dismissed"] = [s for s in _session_state["dismissed"] if s["orden"] != orden]
+    op, error = _resolver_accion(request.get_json(silent=True) or {}, _current())
+    if error:
+        return jsonify({"status": "error", "message": error[0]}), error[1]
+
+    # Lectura-modificación-escritura atómica: otro worker puede estar registrando a la vez
+    state, _ = get_store().update(_ACCIONES_KEY, lambda st: _registrar_acciones(st, [op]))
 
     return jsonify({
         "status":   "ok",
-        "orden":    orden,
-        "accion":   accion,
-        "aplicadas":   len(_session_state["applied"]),
-        "descartadas": len(_session_state["dismissed"]),
+        "orden":    op[0],
+        "tipo":     op[1],
+        "accion":   op[3],
+        "aplicadas":   state["conteo"]["aplicada"],
+        "descartadas": state["conteo"]["descartada"],
+    })
+
+
+@api_bp.post("/sugerencias/acciones")
+def post_sugerencias_acciones():
+    """
+    Varias acciones en un solo request (p. ej. un supervisor que aprueba 30
+    movimientos). Se registran juntas, en una sola escritura; las inválidas
+    se informan por ítem sin frenar las demás.
+    Body: {"acciones": [{"orden"|"id", ["orden_b"], "accion"}, ...]}
+    """
+    specs = (request.get_json(silent=True) or {}).get("acciones")
+    if not isinstance(specs, list) or not specs:
+        return jsonify({"status": "error", "message": "acciones requerido (lista no vacía)"}), 400
+    if len(specs) > _MAX_ACCIONES_LOTE:
+        return jsonify({"status": "error", "message": f"Máximo {_MAX_ACCIONES_LOTE} acciones por request"}), 400
+
+    cur = _current()
+    ops, resultados = [], []
+    for spec in specs:
+        op, error = _resolver_accion(spec, cur)
+        if error:
+            spec = spec if isinstance(spec, dict) else {}
+            resultados.append({"id": spec.get("id") or spec.get("orden"), "accion": spec.get("accion"),
+                               "status": "error", "message": error[0]})
+        else:
+            ops.append(op)
+            resultados.append({"id": op[0], "tipo": op[1], "accion": op[3], "status": "ok"})
+
+    if ops:
+        state, _ = get_store().update(_ACCIONES_KEY, lambda st: _registrar_acciones(st, ops))
+    else:
+        state, _ = _acciones()
+    return jsonify({
+        "status":      "ok",
+        "registradas": len(ops),
+        "errores":     len(specs) - len(ops),
+        "resultados":  resultados,
+        "aplicadas":   state["conteo"]["aplicada"],
+        "descartadas": state["conteo"]["descartada"],
     })
 
 
@@ -163,18 +416,20 @@ def post_sugerencia_accion():
 
 @api_bp.post("/refresh")
 def post_refresh():
-    """Fuerza recarga de datos desde Metabase e invalida el caché."""
+    """
+    Invalida el caché y encola un recálculo desde Metabase. Responde de
+    inmediato (202) con el job_id; el estado se consulta en /api/jobs/<id>
+    y mientras tanto los GET sirven el resultado anterior marcado stale.
+    """
     try:
         invalidate_cache()
-        _session_state["last_result"] = None
-        result = _get_result(force=True)
+        job_id = recompute_worker.submit(_recalcular, "refresh", coalesce=True)
         return jsonify({
             "status":      "ok",
-            "mensaje":     "Datos actualizados desde Metabase",
-            "generado_en": result.get("generado_en"),
-            "total_ordenes": result["resumen"]["total_ordenes"],
+            "mensaje":     "Recálculo en segundo plano",
+            "job_id":      job_id,
             "cache":       cache_info(),
-        })
+        }), 202
     except Exception as e:
         logger.exception("Error en /api/refresh")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -185,40 +440,65 @@ def post_refresh():
 @api_bp.post("/upload")
 def post_upload():
     """
-    Sube un archivo Excel como fuente de datos alternativa.
+    Sube un archivo (Excel .xlsx, CSV o NDJSON) como fuente de datos alternativa.
     Solo activo si Metabase no está configurado o falla.
     No guarda el archivo en disco permanentemente.
+    El parseo y la nivelación corren en el worker de recálculo: responde 202
+    con el job_id (estado en /api/jobs/<id>).
     """
     if "file" not in request.files:
         return jsonify({"status": "error", "message": "No se envió archivo"}), 400
 
     f = request.files["file"]
-    if not f.filename or not f.filename.lower().endswith(".xlsx"):
-        return jsonify({"status": "error", "message": "Solo se aceptan archivos .xlsx"}), 400
+    parse, fuente = parser_for(f.filename)
+    if parse is None:
+        return jsonify({"status": "error", "message": "Solo se aceptan archivos .xlsx, .csv o .ndjson"}), 400
 
+    spool, job_id = None, None
     try:
-        file_bytes = f.read()  # Leer en memoria, sin guardar en disco
-        orders = load_from_bytes(file_bytes, f.filename)
-        result = run_leveling(orders)
-        _session_state["last_result"] = result
+        # Spool acotado (memoria hasta UPLOAD_SPOOL_MAX_BYTES, luego temporal
+        # que se borra al terminar el job); las filas se normalizan a medida
+        # que se leen. Si el mismo archivo (SHA-256) ya se subió, se salta el parseo.
+        spool, digest = spool_upload(f.stream)
+        orders, cache_hit = upload_cache.load_upload(spool, digest, f.filename, parse)
+        job_id = recompute_worker.submit(
+            lambda: run_leveling(orders, incremental=INCREMENTAL_LEVELING,
+                                 parallel=PARALLEL_LEVELING),
+            "upload", cleanup=spool.close,
+        )
         return jsonify({
             "status":        "ok",
-            "fuente":        "excel",
+            "fuente":        fuente,
             "archivo":       f.filename,
-            "total_ordenes": result["resumen"]["total_ordenes"],
-            "generado_en":   result.get("generado_en"),
-        })
+            "cache_hit":     cache_hit,
+            "job_id":        job_id,
+        }), 202
     except Exception as e:
-        logger.exception("Error procesando Excel")
+        logger.exception("Error procesando archivo %s", fuente)
+        # Sin job encolado nadie más cierra el spool (puede ser un temporal en disco)
+        if spool is not None and job_id is None:
+            spool.close()
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+# ─── /api/jobs ───────────────────────────────
+
+@api_bp.get("/jobs/<job_id>")
+def get_job(job_id):
+    """Estado de un recálculo encolado (en_cola | ejecutando | publicado | ok | error)."""
+    job = recompute_worker.job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Job {job_id} no encontrado"}), 404
+    return jsonify({"status": "ok", "job": job})
+
+
 # ─── /api/cache ──────────────────────────────
 
 @api_bp.get("/cache")
 def get_cache():
     """Estado actual del caché de datos."""
-    return jsonify({"status": "ok", "cache": cache_info()})
+    return jsonify({"status": "ok", "cache": cache_info(),
+                    "upload_cache": upload_cache.cache_info()})
 
 
 # ─── /api/export (secundario, no default) ───
@@ -268,36 +548,39 @@ def get_appointments_export():
     Incluye movibles + bloqueados con campos de tracking.
     """
     try:
-        result = _get_result()
-
-        movibles   = result.get("ordenes_movibles",  [])
-        bloqueadas = result.get("ordenes_bloqueadas", [])
-        todas = movibles + bloqueadas
-
-        appointments = []
-        for o in todas:
-            appointments.append({
-                "appointment_id":      o.get("id", ""),
-                "fecha_cita":          o.get("fecha_cita") or o.get("updated_at", "")[:10] if o.get("updated_at") else "",
-                "estado":              o.get("estado", ""),
-                "estado_anterior":     o.get("estado_anterior", ""),
-                "tipo_cita":           o.get("tipo", ""),
-                "tecnico":             o.get("tecnico", ""),
-                "supervisor":          o.get("supervisor", ""),
-                "zona":                o.get("zona", ""),
-                "motivo_cancelacion":  o.get("motivo", ""),
-                "fecha_original":      "",
-                "fecha_nueva":         "",
-                "hora_evento":         o.get("hora_evento", ""),
-                "observacion":         o.get("subzona", ""),
-            })
-
-        return jsonify({
-            "status":       "ok",
-            "total":        len(appointments),
-            "generado_en":  result.get("generado_en", ""),
-            "appointments": appointments,
-        })
+        cur = _current()
+        result = cur["result"]
+
+        def build():
+            movibles   = result.get("ordenes_movibles",  [])
+            bloqueadas = result.get("ordenes_bloqueadas", [])
+            todas = movibles + bloqueadas
+
+            appointments = []
+            for o in todas:
+                appointments.append({
+                    "appointment_id":      o.get("id", ""),
+                    "fecha_cita":          o.get("fecha_cita") or o.get("updated_at", "")[:10] if o.get("updated_at") else "",
+                    "estado":              o.get("estado", ""),
+                    "estado_anterior":     o.get("estado_anterior", ""),
+                    "tipo_cita":           o.get("tipo", ""),
+                    "tecnico":             o.get("tecnico", ""),
+                    "supervisor":          o.get("supervisor", ""),
+                    "zona":                o.get("zona", ""),
+                    "motivo_cancelacion":  o.get("motivo", ""),
+                    "fecha_original":      "",
+                    "fecha_nueva":         "",
+                    "hora_evento":         o.get("hora_evento", ""),
+                    "observacion":         o.get("subzona", ""),
+                })
+
+            return {
+                "status":       "ok",
+                "total":        len(appointments),
+                "generado_en":  result.get("generado_en", ""),
+                "appointments": appointments,
+            }
+        return _result_response(cur, build)
     except Exception as e:
         logger.exception("Error en /api/appointments/export")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -2,35 +2,44 @@
 routes/blacklist.py
 Gestion de lista negra de tecnicos.
 Los tecnicos en la lista negra se excluyen de las sugerencias de nivelacion.
+La lista vive en services.state_store para que todos los workers la compartan.
 """
 import logging
 from flask import Blueprint, jsonify, request
+from services.state_store import get_store
 
 logger = logging.getLogger(__name__)
 blacklist_bp = Blueprint("blacklist", __name__, url_prefix="/api/blacklist")
 
-_blacklist = set()
+_BLACKLIST_KEY = "blacklist"
 
 
 def get_blacklist():
-    return sorted(_blacklist)
+    return get_store().get(_BLACKLIST_KEY, [])
+
+
+def _update(fn):
+    """Aplica fn(set) a la lista compartida de forma atómica; devuelve la lista nueva."""
+    return get_store().update(_BLACKLIST_KEY, lambda lst: sorted(fn(set(lst))), [])[0]
 
 
 def is_blacklisted(tecnico):
-    return tecnico in _blacklist
+    return tecnico in get_blacklist()
 
 
 def filter_suggestions(sugerencias):
-    if not _blacklist:
+    blacklist = set(get_blacklist())
+    if not blacklist:
         return sugerencias
     return [s for s in sugerencias
-            if s.get("tecnico_actual") not in _blacklist
-            and s.get("tecnico_sugerido") not in _blacklist]
+            if s.get("tecnico_actual") not in blacklist
+            and s.get("tecnico_sugerido") not in blacklist]
 
 
 @blacklist_bp.get("")
 def get_list():
-    return jsonify({"status":"ok","blacklist":get_blacklist(),"total":len(_blacklist)})
+    blacklist = get_blacklist()
+    return jsonify({"status":"ok","blacklist":blacklist,"total":len(blacklist)})
 
 
 @blacklist_bp.post("/add")
@@ -39,21 +48,21 @@ def add_tech():
     tecnico = str(body.get("tecnico","")).strip()
     if not tecnico:
         return jsonify({"status":"error","message":"Campo tecnico requerido"}),400
-    _blacklist.add(tecnico)
-    logger.info(f"Lista negra: +'{tecnico}' total={len(_blacklist)}")
-    return jsonify({"status":"ok","mensaje":f"'{tecnico}' agregado a lista negra","blacklist":get_blacklist()})
+    blacklist = _update(lambda s: s | {tecnico})
+    logger.info(f"Lista negra: +'{tecnico}' total={len(blacklist)}")
+    return jsonify({"status":"ok","mensaje":f"'{tecnico}' agregado a lista negra","blacklist":blacklist})
 
 
 @blacklist_bp.post("/remove")
 def remove_tech():
     body = request.get_json(silent=True) or {}
     tecnico = str(body.get("tecnico","")).strip()
-    _blacklist.discard(tecnico)
-    return jsonify({"status":"ok","mensaje":f"'{tecnico}' removido","blacklist":get_blacklist()})
+    blacklist = _update(lambda s: s - {tecnico})
+    return jsonify({"status":"ok","mensaje":f"'{tecnico}' removido","blacklist":blacklist})
 
 
 @blacklist_bp.post("/clear")
 def clear_list():
-    count = len(_blacklist)
-    _blacklist.clear()
+    count = len(get_blacklist())
+    _update(lambda s: set())
     return jsonify({"status":"ok","mensaje":f"{count} tecnicos removidos","blacklist":[]})
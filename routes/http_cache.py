@@ -0,0 +1,82 @@
+"""
+routes/http_cache.py
+Respuestas JSON con GET condicional (ETag / Last-Modified -> 304), gzip y
+bytes pre-serializados que se reutilizan mientras la versión del dato no cambie.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from flask import Response, current_app, request
+
+GZIP_MIN_BYTES = 1024      # payloads menores no compensan el gzip
+_MAX_ENTRIES   = 128       # combinaciones endpoint + query cacheadas
+
+_cache = OrderedDict()     # full_path -> {"version", "body", "gzip", "etag"}
+_lock  = threading.Lock()
+
+
+def _serialize(payload) -> dict:
+    body = (current_app.json.dumps(payload) + "\n").encode("utf-8")
+    return {
+        "body": body,
+        "gzip": gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None,
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+    }
+
+
+def _respond(entry: dict, modified: float = None, extra: dict = None) -> Response:
+    headers = {
+        **(extra or {}),
+        "ETag":          f'"{entry["etag"]}"',
+        "Cache-Control": "no-cache",          # el navegador revalida en cada llamada
+        "Vary":          "Accept-Encoding",
+    }
+    if modified:
+        headers["Last-Modified"] = formatdate(modified, usegmt=True)
+
+    if request.if_none_match:
+        if request.if_none_match.contains_weak(entry["etag"]):
+            return Response(status=304, headers=headers)
+    elif modified and request.if_modified_since:
+        if int(modified) <= request.if_modified_since.timestamp():
+            return Response(status=304, headers=headers)
+
+    body = entry["body"]
+    if entry["gzip"] is not None and "gzip" in request.accept_encodings:
+        body = entry["gzip"]
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+def cached_json(version, build, modified: float = None, headers: dict = None) -> Response:
+    """
+    Respuesta JSON de build() con ETag, Last-Modified y gzip.
+
+    version:  valor hashable que cambia cuando cambia el dato. Mientras sea el
+              mismo, se reutilizan los bytes ya serializados y build() no se
+              llama. None = dato volátil: se serializa en cada llamada (el ETag
+              sigue permitiendo 304 si el contenido no cambió).
+    modified: epoch del último cambio, para Last-Modified / If-Modified-Since.
+    headers:  headers adicionales (no forman parte de los bytes cacheados).
+    """
+    key = request.full_path
+    entry = None
+    if version is not None:
+        with _lock:
+            entry = _cache.get(key)
+            if entry is not None and entry["version"] == version:
+                _cache.move_to_end(key)
+            else:
+                entry = None
+    if entry is None:
+        entry = _serialize(build())
+        entry["version"] = version
+        if version is not None:
+            with _lock:
+                _cache[key] = entry
+                _cache.move_to_end(key)
+                while len(_cache) > _MAX_ENTRIES:
+                    _cache.popitem(last=False)
+    return _respond(entry, modified, headers)
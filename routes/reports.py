@@ -3,8 +3,10 @@ routes/reports.py
 Endpoints del apartado de reportes diarios.
 """
 import logging
+from datetime import datetime, timedelta
 from flask import Blueprint, jsonify, request, Response
 from services import snapshot_service as ss
+from routes.http_cache import cached_json
 
 logger = logging.getLogger(__name__)
 reports_bp = Blueprint("reports", __name__, url_prefix="/api/reports")
@@ -13,32 +15,41 @@ reports_bp = Blueprint("reports", __name__, url_prefix="/api/reports")
 def _get_orders():
     """Obtiene las ordenes del resultado vigente para tomar una foto manual."""
     try:
-        from routes.api import _session_state
-        result = (_session_state.get("last_result") or {})
+        from services import recompute_worker
+        result = (recompute_worker.current()["result"] or {})
         return list(result.get("ordenes_movibles") or []) + list(result.get("ordenes_bloqueadas") or [])
     except Exception as e:
         logger.warning("_get_orders error: %s", e)
         return []
 
 
+def _en_bloques(data: bytes, size: int = 64 * 1024):
+    """Envía el Excel (ya armado y cacheado) por partes."""
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
 @reports_bp.get("/snapshots")
 def get_snapshots():
     try:
         hoy = ss._now_naive().strftime("%Y-%m-%d")
         fecha = request.args.get("fecha") or hoy
-        cortes = ss.get_cortes(fecha)
-        return jsonify({
-            "status": "ok",
-            "fecha": hoy,
-            "fecha_solicitada": fecha,
-            "cortes": cortes,
-            "resumen": ss.get_resumen_ejecutivo(fecha),
-            "ordenes_reprogramadas": ss.get_ordenes_reprogramadas_consolidadas(fecha),
-            "total": len(cortes),
-            "fechas": ss.get_fechas(),
-            "solo_hoy": True,
-            "message": "El informe disponible corresponde solamente al dia actual.",
-        })
+
+        def build():
+            cortes = ss.get_cortes(fecha)
+            return {
+                "status": "ok",
+                "fecha": hoy,
+                "fecha_solicitada": fecha,
+                "cortes": cortes,
+                "resumen": ss.get_resumen_ejecutivo(fecha),
+                "ordenes_reprogramadas": ss.get_ordenes_reprogramadas_consolidadas(fecha),
+                "total": len(cortes),
+                "fechas": ss.get_fechas(),
+                "solo_hoy": True,
+                "message": "El informe disponible corresponde solamente al dia actual.",
+            }
+        return cached_json(ss.store_version(), build, ss.store_modified())
     except Exception as e:
         logger.exception("Error en /api/reports/snapshots")
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -94,10 +105,11 @@ def get_export():
         data = ss.generar_excel(hoy)
         filename = f"reporte_seguimiento_fotografico_{hoy}.xlsx"
         return Response(
-            data,
+            _en_bloques(data),
             mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={
                 "Content-Disposition": f'attachment; filename="{filename}"',
+                "Content-Length": str(len(data)),
                 "Cache-Control": "no-store, max-age=0",
             },
         )
@@ -106,6 +118,37 @@ def get_export():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@reports_bp.get("/range")
+def get_range():
+    """
+    Tendencia de días cerrados: ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD (por defecto, los últimos 7).
+
+    cancelados / reprogramados: totales del resumen ejecutivo de cada día.
+    canceladas_detectadas / ordenes_reprogramadas: desglose por franja y tipo
+    (aumentos de canceladas por celda y ordenes identificadas que salieron);
+    son otras medidas y sus sumas no coinciden con los totales.
+    """
+    try:
+        ayer = ss._now_naive() - timedelta(days=1)
+        hasta = request.args.get("hasta") or ayer.strftime("%Y-%m-%d")
+        desde = request.args.get("desde") or (
+            datetime.strptime(hasta, "%Y-%m-%d") - timedelta(days=6)).strftime("%Y-%m-%d")
+        for valor in (desde, hasta):
+            datetime.strptime(valor, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"status": "error", "message": "desde/hasta deben tener formato YYYY-MM-DD"}), 400
+    if desde > hasta:
+        return jsonify({"status": "error", "message": "desde no puede ser posterior a hasta"}), 400
+    try:
+        version, modified = ss.archivo_version()
+        return cached_json(version, lambda: {"status": "ok", **ss.get_rango(desde, hasta)}, modified)
+    except Exception as e:
+        logger.exception("Error en /api/reports/range")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @reports_bp.get("/fechas")
 def get_fechas():
-    return jsonify({"status": "ok", "fechas": ss.get_fechas(), "solo_hoy": True})
+    return cached_json(ss.store_version(),
+                       lambda: {"status": "ok", "fechas": ss.get_fechas(), "solo_hoy": True},
+                       ss.store_modified())
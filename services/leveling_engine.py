@@ -5,8 +5,15 @@ Entrada: lista de dicts (de Metabase o Excel).
 Salida: dict JSON con resumen, alertas, sugerencias, carga por técnico y franja.
 Sin dependencias de openpyxl ni generación de archivos Excel.
 """
+import hashlib
 import logging
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
+from itertools import chain
 from config import (
     MAX_IDEAL_LOAD, MIN_IDEAL_LOAD, MAX_ABSOLUTE_LOAD, MAX_ORDERS_PER_SLOT,
     MAX_DUPLICATED_SLOTS, MIN_IMBALANCE_TO_MOVE, ORDER_DURATION_HOURS,
@@ -21,16 +28,23 @@ from config import (
     ALCANZADO_BUFFER_HOURS, T2_MAX_ORDERS_10H_SLOT,
     GEO_BONUS_0_5KM, GEO_BONUS_1KM, GEO_BONUS_2KM, GEO_PENALTY_OVER,
     FRANJA_DUP_PENALTY, RUTA_DISPERSA_KM, GEO_CENTROID_RADIUS,
+    PARALLEL_LEVELING_WORKERS,
 )
 from services.normalization import (
-    normalize_order, haversine, get_centroid, is_same_unit, order_has_coords,
+    normalize_order, haversine, haversine_matrix, HAS_NUMPY,
+    get_centroid, is_same_unit, order_has_coords,
     parse_franja_hours, get_status_progress, status_effective_weight,
     status_completion_credit, norm_zone, is_movable, is_blocked,
-    norm_status, detect_turno,
+    detect_turno, status_info,
+    ST_EN_SITIO, ST_INICIADO, ST_EN_CAMINO, ST_CANCELADO, ST_ACTIVO,
 )
 
 logger = logging.getLogger(__name__)
 
+# Radio máximo (km) entre una orden y el punto de referencia de un receptor;
+# más allá el receptor se descarta antes de calcular el score.
+RECEIVER_RADIUS_KM = MAX_DIST_EXCEPTION_KM * 1.5
+
 # ─── Utilidades internas ──────────────────────
 
 def _count_duplicated_slots(franja_counts: dict) -> int:
@@ -87,20 +101,17 @@ def _tech_reference_point(tech: str, tech_orders: dict, tech_locs: dict):
 
     # 1. En sitio (progress=2) — posición más confiable
     for o in orders:
-        st = str(o.get("estado", "")).lower()
-        if "en sitio" in st and o.get("lat") and o.get("lon"):
+        if o.get("status_code", 0) & ST_EN_SITIO and o.get("lat") and o.get("lon"):
             return (o["lat"], o["lon"])
 
     # 2. Iniciado/a (progress=3-5) — está trabajando en ese punto
     for o in orders:
-        st = str(o.get("estado", "")).lower()
-        if any(k in st for k in ("iniciado", "iniciada", "trabajando")) and o.get("lat") and o.get("lon"):
+        if o.get("status_code", 0) & ST_INICIADO and o.get("lat") and o.get("lon"):
             return (o["lat"], o["lon"])
 
     # 3. En camino (progress=1) — su destino es la referencia
     for o in orders:
-        st = str(o.get("estado", "")).lower()
-        if "en camino" in st and o.get("lat") and o.get("lon"):
+        if o.get("status_code", 0) & ST_EN_CAMINO and o.get("lat") and o.get("lon"):
             return (o["lat"], o["lon"])
 
     # 4. Próxima orden programada (la que tiene franja más temprana pendiente)
@@ -121,13 +132,30 @@ def _tech_reference_point(tech: str, tech_orders: dict, tech_locs: dict):
 def _get_active_order(tech: str, tech_orders: dict) -> dict:
     """Retorna la orden activa (En sitio o Iniciado) del técnico, si existe."""
     for o in tech_orders.get(tech, []):
-        st = str(o.get("estado", "")).lower()
-        if any(k in st for k in ("en sitio", "iniciado", "iniciada", "trabajando")):
+        if o.get("status_code", 0) & ST_ACTIVO:
             return o
     return {}
 
 
-def _dist_to_tech(order: dict, tech: str, tech_orders: dict, tech_locs: dict):
+def _tech_geo_context(tech: str, tech_orders: dict) -> list:
+    """
+    Contexto geográfico (zona, subzona, ciudad) de las órdenes del técnico,
+    ya normalizado y sin repetidos, para el fallback de _dist_to_tech.
+    """
+    ctx = []
+    seen = set()
+    for t_ord in tech_orders.get(tech, []):
+        t_zona    = (t_ord.get("zona")    or "").upper().strip()
+        t_subzona = (t_ord.get("subzona") or "").upper().strip()
+        t_ciudad  = (t_ord.get("ciudad")  or t_zona).upper().strip()
+        key = (t_zona, t_subzona, t_ciudad)
+        if key not in seen:
+            seen.add(key)
+            ctx.append(key)
+    return ctx
+
+
+def _dist_to_tech(order: dict, tech: str, idx: dict, stage: dict = None):
     """
     Distancia estimada entre una orden y el técnico.
     Prioridad:
@@ -136,29 +164,27 @@ def _dist_to_tech(order: dict, tech: str, tech_orders: dict, tech_locs: dict):
       3. Zona/Subzona coincidente → distancia simbólica baja (misma área)
       4. Ciudad coincidente → distancia simbólica media
       5. Sin datos → None (penalización en scoring)
+    Usa el punto de referencia y el contexto geográfico precalculados en _build_indexes
+    y, si se pasa, la matriz de distancias de _build_distance_stage.
     """
     order_lat = order.get("lat") or 0.0
     order_lon = order.get("lon") or 0.0
-    ref = _tech_reference_point(tech, tech_orders, tech_locs)
+    ref = idx["tech_ref_point"].get(tech, (0.0, 0.0))
 
     # 1 y 2: coords disponibles en ambos lados → Haversine exacto
     if order_lat and order_lon and ref != (0.0, 0.0):
-        return haversine(order_lat, order_lon, ref[0], ref[1])
+        return _staged_haversine(stage, "ref", order, tech, ref[0], ref[1])
 
     # 3: sin coords → fallback por zona/subzona/ciudad
-    tech_ords = tech_orders.get(tech, [])
-    if not tech_ords:
+    geo_ctx = idx["tech_geo_ctx"].get(tech)
+    if not geo_ctx:
         return None
 
     order_zona    = (order.get("zona")    or "").upper().strip()
     order_subzona = (order.get("subzona") or "").upper().strip()
     order_ciudad  = (order.get("ciudad")  or order_zona).upper().strip()
 
-    for t_ord in tech_ords:
-        t_zona    = (t_ord.get("zona")    or "").upper().strip()
-        t_subzona = (t_ord.get("subzona") or "").upper().strip()
-        t_ciudad  = (t_ord.get("ciudad")  or t_zona).upper().strip()
-
+    for t_zona, t_subzona, t_ciudad in geo_ctx:
         if order_subzona and order_subzona == t_subzona and order_subzona != "SIN_SUBZONA":
             return 0.5   # Misma subzona: distancia simbólica muy baja
         if order_zona and order_zona == t_zona and order_zona != "SIN_ZONA":
@@ -169,6 +195,97 @@ def _dist_to_tech(order: dict, tech: str, tech_orders: dict, tech_locs: dict):
     return None  # Sin ningún dato geográfico en común
 
 
+def _build_distance_stage(orders: list, idx: dict):
+    """
+    Distancias orden×técnico calculadas en un solo lote con NumPy para el scoring
+    de sugerencias: hacia el punto de referencia, la orden activa y el centroide
+    de cada técnico. Solo cubre órdenes y puntos con coordenadas; cualquier par
+    fuera de la matriz se calcula con haversine() como antes.
+    Sin NumPy devuelve None y el motor usa el cálculo escalar par a par.
+    """
+    if not HAS_NUMPY:
+        return None
+    geo_orders = [o for o in orders if o.get("lat") and o.get("lon")]
+    if not geo_orders:
+        return None
+    order_pts = [(o["lat"], o["lon"]) for o in geo_orders]
+
+    def _columns(points: dict) -> tuple:
+        techs = list(points)
+        return ({t: j for j, t in enumerate(techs)},
+                haversine_matrix(order_pts, [points[t] for t in techs]))
+
+    ref_pts = {
+        t: p for t, p in idx["tech_ref_point"].items() if p != (0.0, 0.0)
+    }
+    active_pts = {
+        t: (a["lat"], a["lon"]) for t, a in idx["tech_active"].items()
+        if a.get("lat") and a.get("lon")
+    }
+    centroid_pts = {
+        t: c for t, c in idx["tech_centroid"].items() if c and c != (0.0, 0.0)
+    }
+    return {
+        "row":      {id(o): i for i, o in enumerate(geo_orders)},  # identidad: los ids pueden repetirse
+        "ref":      _columns(ref_pts),
+        "active":   _columns(active_pts),
+        "centroid": _columns(centroid_pts),
+    }
+
+
+def _staged_haversine(stage, kind: str, order: dict, tech: str,
+                      lat: float, lon: float) -> float:
+    """Distancia orden↔punto del técnico: desde la matriz si está, si no haversine()."""
+    if stage is not None:
+        i = stage["row"].get(id(order))
+        col, matrix = stage[kind]
+        j = col.get(tech)
+        if i is not None and j is not None:
+            return matrix[i][j]
+    return haversine(lat, lon, order["lat"], order["lon"])
+
+
+def _build_tech_grid(tech_ref_point: dict, radius_km: float) -> dict:
+    """
+    Grilla uniforme (celdas de radius_km de lado) sobre los puntos de referencia
+    de los técnicos. Todo técnico a <= radius_km de un punto está en su celda
+    o en una de las 8 vecinas, así que basta revisar ese bloque de 3x3.
+    Los técnicos sin punto de referencia van aparte en "sin_ref".
+    """
+    located = {t: p for t, p in tech_ref_point.items() if p != (0.0, 0.0)}
+    max_lat = max((abs(p[0]) for p in located.values()), default=0.0)
+    # 1° de latitud = 111.19 km con R=6371; la longitud se encoge con cos(lat)
+    cell_lat = radius_km / 111.0
+    cell_lon = radius_km / (111.0 * max(math.cos(math.radians(max_lat)), 0.01))
+    cells = {}
+    for t, (lat, lon) in located.items():
+        cells.setdefault((math.floor(lat / cell_lat), math.floor(lon / cell_lon)), []).append(t)
+    return {
+        "cell_lat": cell_lat,
+        "cell_lon": cell_lon,
+        "cells":    cells,
+        "sin_ref":  [t for t in tech_ref_point if t not in located],
+    }
+
+
+def _nearby_techs(order: dict, grid: dict):
+    """
+    Técnicos que pueden quedar dentro del radio de la grilla para la orden.
+    Devuelve None si la orden no tiene coordenadas: la distancia cae al fallback
+    por zona (siempre <= 4 km) y ningún técnico se puede descartar.
+    """
+    if not (order.get("lat") and order.get("lon")):
+        return None
+    ci = math.floor(order["lat"] / grid["cell_lat"])
+    cj = math.floor(order["lon"] / grid["cell_lon"])
+    cells = grid["cells"]
+    nearby = list(grid["sin_ref"])
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            nearby.extend(cells.get((ci + di, cj + dj), ()))
+    return nearby
+
+
 def _tech_load_score(tech: str, tech_pending: dict, tech_total: dict,
                      tech_eff_load: dict, tech_credit: dict,
                      tech_franja: dict, tech_subzones: dict, tech_orders: dict) -> float:
@@ -256,8 +373,38 @@ def _can_add_to_franja(tech: str, franja: str, tech_franja: dict,
 
 # ─── Construcción de estructuras de datos ─────
 
-def _build_indexes(orders: list) -> dict:
-    """Construye todos los índices necesarios para el motor a partir de la lista normalizada."""
+def _orders_signature(o_list: list) -> str:
+    """Huella de una lista de órdenes normalizadas en modo incremental (usa su "_hash")."""
+    return hashlib.blake2b("|".join(o["_hash"] for o in o_list).encode(),
+                           digest_size=16).hexdigest()
+
+
+def _tech_derived(tech: str, o_list: list, locs: list) -> dict:
+    """
+    Valores del técnico que solo dependen de su propia lista de órdenes.
+    Es la unidad que el modo incremental reutiliza entre ejecuciones.
+    """
+    one_orders = {tech: o_list}
+    turno = detect_turno(tech, o_list)
+    return {
+        "pending":   sum(1 for o in o_list if o["movible"]),
+        "eff_load":  sum(o["effective_weight"] for o in o_list),
+        "credit":    sum(o["completion_credit"] for o in o_list),
+        "turno":     turno,
+        "shift_end": T2_END_HOUR if turno == "T2" else T1_END_HOUR,
+        "centroid":  get_centroid(locs) if locs else None,
+        "ref_point": _tech_reference_point(tech, one_orders, {tech: locs}),
+        "active":    _get_active_order(tech, one_orders),
+        "geo_ctx":   _tech_geo_context(tech, one_orders),
+    }
+
+
+def _build_indexes(orders: list, prev_derived: dict = None) -> dict:
+    """
+    Construye todos los índices necesarios para el motor a partir de la lista normalizada.
+    prev_derived (modo incremental): derivados por técnico de la ejecución anterior,
+    indexados por (técnico, huella de sus órdenes); las órdenes traen "_hash".
+    """
     tech_orders = {}          # tech -> [orders]
     tech_franja = {}          # tech -> {franja: count_total}
     tech_franja_active = {}   # tech -> {franja: count_no_finalizada_no_cancelada}
@@ -281,7 +428,7 @@ def _build_indexes(orders: list) -> dict:
 
         # tech_franja_active: solo órdenes que aún consumen capacidad
         # Excluye finalizadas (progress >= 6) y canceladas
-        is_done = (o.get("progress", 0) >= 6) or ("cancel" in o.get("estado", "").lower())
+        is_done = (o.get("progress", 0) >= 6) or bool(o.get("status_code", 0) & ST_CANCELADO)
         if not is_done:
             tech_franja_active.setdefault(tech, {})
             tech_franja_active[tech][franja] = tech_franja_active[tech].get(franja, 0) + 1
@@ -307,39 +454,49 @@ def _build_indexes(orders: list) -> dict:
         for t, zones in tech_zone.items()
     }
 
+    # Derivados por técnico (cargas, turno, centroide, referencia, orden activa,
+    # contexto geo). Se calculan una sola vez por ejecución: los generadores de
+    # sugerencias los consultan por cada par (orden, técnico). En modo incremental
+    # se reutilizan los de la ejecución anterior si la lista del técnico no cambió.
+    tech_derived = {}
+    tech_sig = {}
+    derived_cache = {}
+    for t, o_list in tech_orders.items():
+        entry = None
+        if prev_derived is not None:
+            sig = _orders_signature(o_list)
+            tech_sig[t] = sig
+            entry = prev_derived.get((t, sig))
+        if entry is None:
+            entry = _tech_derived(t, o_list, tech_locs.get(t, []))
+        if prev_derived is not None:
+            derived_cache[(t, tech_sig[t])] = entry
+        tech_derived[t] = entry
+
     # Calcular cargas
-    tech_total = {t: len(o_list) for t, o_list in tech_orders.items()}
-    tech_pending = {
-        t: sum(1 for o in o_list if o["movible"])
-        for t, o_list in tech_orders.items()
-    }
-    tech_eff_load = {
-        t: sum(o["effective_weight"] for o in o_list)
-        for t, o_list in tech_orders.items()
-    }
-    tech_credit = {
-        t: sum(o["completion_credit"] for o in o_list)
-        for t, o_list in tech_orders.items()
-    }
+    tech_total    = {t: len(o_list) for t, o_list in tech_orders.items()}
+    tech_pending  = {t: d["pending"]  for t, d in tech_derived.items()}
+    tech_eff_load = {t: d["eff_load"] for t, d in tech_derived.items()}
+    tech_credit   = {t: d["credit"]   for t, d in tech_derived.items()}
 
-    # Turno por técnico (CSV primero, fallback auto-detección)
-    tech_turno = {
-        t: detect_turno(t, o_list)
-        for t, o_list in tech_orders.items()
-    }
-    # Fin de turno por técnico
-    tech_shift_end = {
-        t: (T2_END_HOUR if tech_turno.get(t) == "T2" else T1_END_HOUR)
-        for t in tech_orders
-    }
+    # Turno por técnico (CSV primero, fallback auto-detección) y fin de turno
+    tech_turno     = {t: d["turno"]     for t, d in tech_derived.items()}
+    tech_shift_end = {t: d["shift_end"] for t, d in tech_derived.items()}
 
     # Centroide real de cada técnico (promedio lat/lon de sus órdenes con coords válidas)
     tech_centroid = {
-        t: get_centroid(locs)
+        t: tech_derived[t]["centroid"]
         for t, locs in tech_locs.items()
         if locs
     }
 
+    # Posición de referencia, orden activa y contexto geográfico por técnico
+    tech_ref_point = {t: d["ref_point"] for t, d in tech_derived.items()}
+    tech_active    = {t: d["active"]    for t, d in tech_derived.items()}
+    tech_geo_ctx   = {t: d["geo_ctx"]   for t, d in tech_derived.items()}
+    # Índice espacial para podar receptores lejanos antes del scoring
+    tech_grid = _build_tech_grid(tech_ref_point, RECEIVER_RADIUS_KM)
+
     return {
         "tech_orders":         tech_orders,
         "tech_franja":         tech_franja,
@@ -355,6 +512,12 @@ def _build_indexes(orders: list) -> dict:
         "tech_credit":         tech_credit,
         "tech_turno":          tech_turno,
         "tech_shift_end":      tech_shift_end,
+        "tech_ref_point":      tech_ref_point,        # punto de partida para distancias
+        "tech_active":         tech_active,           # orden En sitio / Iniciado ({} si no hay)
+        "tech_geo_ctx":        tech_geo_ctx,          # [(zona, subzona, ciudad)] para fallback
+        "tech_grid":           tech_grid,             # grilla de puntos de referencia
+        "tech_sig":            tech_sig,              # huella por técnico (solo incremental)
+        "derived_cache":       derived_cache,         # derivados a reutilizar (solo incremental)
     }
 
 
@@ -380,7 +543,10 @@ def _generate_alerts(orders: list, idx: dict, now_dt) -> list:
         "iniciada":  (INICIADO_ALERT_MINUTES,  "INICIADO_PROLONGADO",   "en ejecución (iniciada)"),
     }
     for o in orders:
-        estado_norm = norm_status(o["estado"])
+        # Solo En sitio / Iniciado pueden coincidir: descarta el resto por código
+        if not o.get("status_code", 0) & ST_ACTIVO:
+            continue
+        estado_norm = status_info(o["estado"]).norm
         if estado_norm not in ALERTAS_PROLONGADO:
             continue
         umbral_min, tipo_alerta, desc_estado = ALERTAS_PROLONGADO[estado_norm]
@@ -732,7 +898,7 @@ def _generate_alerts(orders: list, idx: dict, now_dt) -> list:
 # ─── Motor de sugerencias ─────────────────────
 
 def _score_suggestion(order: dict, donor: str, receiver: str,
-                       idx: dict, current_hour: float) -> float:
+                       idx: dict, current_hour: float, stage: dict = None) -> float:
     """
     Score de beneficio de mover 'order' de 'donor' a 'receiver'.
     Usa TOTALES de órdenes como métrica principal.
@@ -744,7 +910,6 @@ def _score_suggestion(order: dict, donor: str, receiver: str,
     tech_orders  = idx["tech_orders"]
     tech_franja  = idx["tech_franja"]
     tech_subzones= idx["tech_subzones"]
-    tech_locs    = idx["tech_locs"]
     tech_total   = idx["tech_total"]
 
     donor_total  = tech_total.get(donor, 0)
@@ -829,19 +994,22 @@ def _score_suggestion(order: dict, donor: str, receiver: str,
 
     # ─── Distancia desde la orden ACTIVA del receptor (En sitio / Iniciado) ───
     # La referencia correcta NO es el centroide sino donde está el técnico AHORA.
-    active_recv = _get_active_order(receiver, tech_orders)
+    tech_active = idx["tech_active"]
+    active_recv = tech_active.get(receiver, {})
     if active_recv.get("lat") and active_recv.get("lon") and order.get("lat") and order.get("lon"):
         # Distancia desde la orden activa del receptor hasta la orden a mover
-        dist_recv = haversine(active_recv["lat"], active_recv["lon"], order["lat"], order["lon"])
+        dist_recv = _staged_haversine(stage, "active", order, receiver,
+                                      active_recv["lat"], active_recv["lon"])
     else:
-        dist_recv = _dist_to_tech(order, receiver, tech_orders, tech_locs)
+        dist_recv = _dist_to_tech(order, receiver, idx, stage)
 
     # Distancia desde la orden activa del donor hasta la orden (para calcular ahorro)
-    active_donor = _get_active_order(donor, tech_orders) if donor not in ("SIN_ASIGNAR", None) else {}
+    active_donor = tech_active.get(donor, {}) if donor not in ("SIN_ASIGNAR", None) else {}
     if active_donor.get("lat") and active_donor.get("lon") and order.get("lat") and order.get("lon"):
-        dist_donor = haversine(active_donor["lat"], active_donor["lon"], order["lat"], order["lon"])
+        dist_donor = _staged_haversine(stage, "active", order, donor,
+                                       active_donor["lat"], active_donor["lon"])
     elif donor not in ("SIN_ASIGNAR", None):
-        dist_donor = _dist_to_tech(order, donor, tech_orders, tech_locs)
+        dist_donor = _dist_to_tech(order, donor, idx, stage)
     else:
         dist_donor = None
 
@@ -876,7 +1044,8 @@ def _score_suggestion(order: dict, donor: str, receiver: str,
     tech_centroid = idx.get("tech_centroid", {})
     recv_centroid = tech_centroid.get(receiver)
     if recv_centroid and recv_centroid != (0.0, 0.0) and order.get("lat") and order.get("lon"):
-        dist_centroid = haversine(recv_centroid[0], recv_centroid[1], order["lat"], order["lon"])
+        dist_centroid = _staged_haversine(stage, "centroid", order, receiver,
+                                          recv_centroid[0], recv_centroid[1])
         if dist_centroid < 1.0:
             score += 600     # Muy cerca del centroide — compacta la ruta
         elif dist_centroid < 2.0:
@@ -923,7 +1092,15 @@ def _score_suggestion(order: dict, donor: str, receiver: str,
     return score
 
 
-def _generate_suggestions(orders: list, idx: dict, current_hour: float) -> list:
+def _generate_suggestions(orders: list, idx: dict, current_hour: float,
+                          memo: dict = None) -> list:
+    """
+    Sugerencias individuales: para cada orden movible de un donante sobrecargado
+    (o sin técnico) elige el mejor receptor, local primero e interzona como último recurso.
+    memo (modo incremental): {"prev": {...}, "next": {}} con (dist_quick, score) por
+    (orden, huella donante, huella receptor); los pares cuyos técnicos no cambiaron
+    se toman de "prev" en lugar de recalcularse.
+    """
     suggestions = []
     movable_orders = [o for o in orders if o["movible"]]
     techs = [t for t in idx["tech_orders"] if t != "SIN_ASIGNAR"]
@@ -932,7 +1109,16 @@ def _generate_suggestions(orders: list, idx: dict, current_hour: float) -> list:
     tech_franja  = idx["tech_franja"]
     tech_total   = idx["tech_total"]
     tech_subzones= idx["tech_subzones"]
-    tech_locs    = idx["tech_locs"]
+    tech_sig     = idx["tech_sig"]
+
+    # Distancias orden×técnico en lote (None sin NumPy → cálculo por par)
+    stage = _build_distance_stage(movable_orders, idx)
+
+    # Posición de cada técnico para visitar a los candidatos de la grilla en el
+    # mismo orden que la lista completa (los empates de score se resuelven igual)
+    tech_pos = {t: i for i, t in enumerate(techs)}
+    deficitarios     = [t for t in techs if tech_total.get(t, 0) < MIN_IDEAL_LOAD]
+    muy_deficitarios = [t for t in techs if tech_total.get(t, 0) < MIN_IDEAL_LOAD - 1]
 
     interzone_count = {}
     sugs_por_receptor = {}   # evitar monopolio: max 3 sugerencias por técnico receptor
@@ -945,10 +1131,7 @@ def _generate_suggestions(orders: list, idx: dict, current_hour: float) -> list:
         # Solo procesar órdenes de técnicos sobrecargados O sin asignar
         if donor not in ("SIN_ASIGNAR", None) and donor_total <= MAX_IDEAL_LOAD:
             # ¿Hay algún técnico por debajo del mínimo que pueda recibir?
-            hay_deficitario = any(
-                tech_total.get(t, 0) < MIN_IDEAL_LOAD
-                for t in techs if t != donor
-            )
+            hay_deficitario = any(t != donor for t in deficitarios)
             if not hay_deficitario:
                 continue  # No hay desequilibrio que justifique mover
 
@@ -958,10 +1141,7 @@ def _generate_suggestions(orders: list, idx: dict, current_hour: float) -> list:
             donor, tech_orders, tech_franja, tech_subzones,
             idx["tech_credit"], idx["tech_pending"], idx["tech_eff_load"]
         ):
-            hay_muy_deficitario = any(
-                tech_total.get(t, 0) < MIN_IDEAL_LOAD - 1
-                for t in techs if t != donor
-            )
+            hay_muy_deficitario = any(t != donor for t in muy_deficitarios)
             if not hay_muy_deficitario:
                 continue  # Técnico eficiente — no perturbar
 
@@ -980,7 +1160,13 @@ def _generate_suggestions(orders: list, idx: dict, current_hour: float) -> list:
         best_cross_score    = -9999.0
         best_cross_receiver = None
 
-        for receiver in techs:
+        nearby = _nearby_techs(order, idx["tech_grid"])
+        if nearby is None:
+            receivers = techs
+        else:
+            receivers = sorted((t for t in set(nearby) if t in tech_pos), key=tech_pos.get)
+
+        for receiver in receivers:
             if receiver == donor:
                 continue
             if tech_total.get(receiver, 0) >= MAX_ABSOLUTE_LOAD:
@@ -997,16 +1183,30 @@ def _generate_suggestions(orders: list, idx: dict, current_hour: float) -> list:
             if order_franja_start < 9.5 and recv_turno == "T2":
                 continue
 
+            cached = None
+            if memo is not None:
+                memo_key = (order["_hash"], tech_sig[donor], tech_sig[receiver])
+                cached = memo["prev"].get(memo_key)
+
             # Cap geográfico
-            dist_quick = _dist_to_tech(order, receiver, tech_orders, tech_locs)
-            if dist_quick is not None and dist_quick > MAX_DIST_EXCEPTION_KM * 1.5:
+            if cached is not None:
+                dist_quick, score = cached
+            else:
+                dist_quick = _dist_to_tech(order, receiver, idx, stage)
+                score = None
+            if dist_quick is not None and dist_quick > RECEIVER_RADIUS_KM:
+                if memo is not None:
+                    memo["next"][memo_key] = (dist_quick, None)
                 continue
 
             recv_zone_r = idx["tech_main_zone"].get(receiver, "SIN_ZONA")
             is_local = (recv_zone_r == order_zone or
                         order_zone in ZONE_ADJACENCY.get(recv_zone_r, []))
 
-            score = _score_suggestion(order, donor, receiver, idx, current_hour)
+            if score is None:
+                score = _score_suggestion(order, donor, receiver, idx, current_hour, stage)
+            if memo is not None:
+                memo["next"][memo_key] = (dist_quick, score)
 
             if is_local:
                 if score > best_local_score:
@@ -1045,8 +1245,8 @@ def _generate_suggestions(orders: list, idx: dict, current_hour: float) -> list:
             if interzone_count[best_receiver] > MAX_INTERZONE_ASSIGNMENTS_PER_TECH:
                 continue
 
-        dist_recv  = _dist_to_tech(order, best_receiver, tech_orders, tech_locs)
-        dist_donor = _dist_to_tech(order, donor, tech_orders, tech_locs) if donor not in ("SIN_ASIGNAR", None) else None
+        dist_recv  = _dist_to_tech(order, best_receiver, idx, stage)
+        dist_donor = _dist_to_tech(order, donor, idx, stage) if donor not in ("SIN_ASIGNAR", None) else None
 
         # Motivo basado en totales (lógica correcta)
         if donor == "SIN_ASIGNAR":
@@ -1169,33 +1369,96 @@ def _nearest_neighbor_chain(start_lat: float, start_lon: float,
     return chain
 
 
-def _two_opt_route(orders: list) -> list:
+def _route_distance_matrix(orders: list) -> list:
+    """
+    Matriz n×n de km entre las órdenes de una ruta (un solo lote con haversine_matrix).
+    Los tramos con una orden sin coords valen 0, igual que en _route_total_km.
+    """
+    n = len(orders)
+    dist = [[0.0] * n for _ in range(n)]
+    geo = [i for i, o in enumerate(orders) if o.get("lat") and o.get("lon")]
+    if len(geo) < 2:
+        return dist
+    pts = [(orders[i]["lat"], orders[i]["lon"]) for i in geo]
+    sub = haversine_matrix(pts, pts)
+    for a, i in enumerate(geo):
+        row = dist[i]
+        sub_row = sub[a]
+        for b, j in enumerate(geo):
+            row[j] = sub_row[b]
+    return dist
+
+
+def _optimize_route(orders: list) -> list:
     """
-    Optimización 2-opt: mejora la secuencia de órdenes reduciendo cruces de ruta.
-    Opera sobre la lista ya ordenada por nearest-neighbor para pulir el resultado.
+    Pule la secuencia de una ruta con movimientos 2-opt y Or-opt evaluados en O(1)
+    sobre una matriz de distancias precalculada. Respeta el orden de franjas:
+    la secuencia queda ordenada por hora de inicio y ningún movimiento saca una
+    orden de su franja. La primera orden de esa secuencia (en la ruta del
+    nearest-neighbor, la más cercana al técnico) queda fija.
     """
-    if len(orders) <= 3:
+    if len(orders) <= 2:
         return orders
 
-    def route_km(seq):
-        total = 0.0
-        for i in range(len(seq) - 1):
-            a, b = seq[i], seq[i + 1]
-            if a.get("lat") and a.get("lon") and b.get("lat") and b.get("lon"):
-                total += haversine(a["lat"], a["lon"], b["lat"], b["lon"])
-        return total
+    def franja_key(o):
+        return parse_franja_hours(o.get("franja", ""))[0] or 99
+
+    seq = sorted(orders, key=franja_key)   # estable: conserva el orden dentro de la franja
+    keys = [franja_key(o) for o in seq]
+    dist = _route_distance_matrix(seq)
+    n = len(seq)
+    route = list(range(n))   # posiciones → índice en seq/dist
+    eps = 1e-9
+
+    def d(a, b):
+        return dist[route[a]][route[b]] if 0 <= a < n and 0 <= b < n else 0.0
 
-    best = list(orders)
     improved = True
     while improved:
         improved = False
-        for i in range(1, len(best) - 2):
-            for k in range(i + 1, len(best) - 1):
-                candidate = best[:i] + best[i:k + 1][::-1] + best[k + 1:]
-                if route_km(candidate) < route_km(best):
-                    best = candidate
+
+        # 2-opt: invertir route[i..k]; válido solo dentro de una misma franja
+        for i in range(1, n - 1):
+            for k in range(i + 1, n):
+                if keys[route[k]] != keys[route[i]]:
+                    break
+                delta = (d(i - 1, k) + d(i, k + 1)) - (d(i - 1, i) + d(k, k + 1))
+                if delta < -eps:
+                    route[i:k + 1] = route[i:k + 1][::-1]
                     improved = True
-    return best
+
+        # Or-opt: mover un tramo de 1-3 órdenes de la misma franja a otra posición
+        for seg_len in (1, 2, 3):
+            i = 1
+            while i + seg_len <= n:
+                j = i + seg_len - 1
+                seg_key = keys[route[i]]
+                if keys[route[j]] != seg_key:
+                    i += 1
+                    continue
+                removed = d(i - 1, i) + d(j, j + 1) - d(i - 1, j + 1)
+                moved = False
+                for p in range(0, n):
+                    if i - 1 <= p <= j:
+                        continue   # mismo lugar o dentro del tramo
+                    # Insertar entre p y p+1 sin romper el orden de franjas
+                    nxt = p + 1
+                    if keys[route[p]] > seg_key or (nxt < n and keys[route[nxt]] < seg_key):
+                        continue
+                    added = (dist[route[p]][route[i]]
+                             + (dist[route[j]][route[nxt]] if nxt < n else 0.0)
+                             - (dist[route[p]][route[nxt]] if nxt < n else 0.0))
+                    if added - removed < -eps:
+                        segment = route[i:j + 1]
+                        rest = route[:i] + route[j + 1:]
+                        at = p + 1 if p < i else p + 1 - seg_len
+                        route = rest[:at] + segment + rest[at:]
+                        improved = moved = True
+                        break
+                if not moved:
+                    i += 1
+
+    return [seq[r] for r in route]
 
 
 def _route_total_km(orders: list) -> float:
@@ -1263,8 +1526,8 @@ def _generate_route_suggestions(orders: list, idx: dict) -> list:
                 continue
 
             # ── Punto de inicio: orden activa (En sitio / Iniciado) del técnico ──
-            tech_ref = _tech_reference_point(tech, idx["tech_orders"], idx["tech_locs"])
-            active_order = _get_active_order(tech, idx["tech_orders"])
+            tech_ref = idx["tech_ref_point"].get(tech, (0.0, 0.0))
+            active_order = idx["tech_active"].get(tech, {})
             start_lat = active_order.get("lat") or (tech_ref[0] if tech_ref != (0.0, 0.0) else None)
             start_lon = active_order.get("lon") or (tech_ref[1] if tech_ref != (0.0, 0.0) else None)
 
@@ -1294,9 +1557,9 @@ def _generate_route_suggestions(orders: list, idx: dict) -> list:
                     franjas_usadas[f] = franjas_usadas.get(f, 0) + 1
                 ordenes_validas.append(o)
 
-            # ── 2-opt: optimizar secuencia final para reducir cruces ──
-            if len(ordenes_validas) > 3:
-                ordenes_validas = _two_opt_route(ordenes_validas)
+            # ── 2-opt + Or-opt: optimizar secuencia final sin salir de cada franja ──
+            if len(ordenes_validas) > 2:
+                ordenes_validas = _optimize_route(ordenes_validas)
 
             # Solo generar ruta si aporta al menos 2 órdenes (una sola no es "ruta")
             if len(ordenes_validas) < 2:
@@ -1366,6 +1629,44 @@ def _generate_route_suggestions(orders: list, idx: dict) -> list:
 
 # ─── Sugerencias de intercambio bidireccional ─────────────────────────────────
 
+def _swap_point(tech: str, idx: dict):
+    """
+    Punto desde el que _generate_swap_suggestions mide las órdenes con coords del
+    técnico: su orden activa si tiene coords, si no su punto de referencia.
+    None si no hay ninguno (la distancia cae al fallback por zona).
+    """
+    active = idx["tech_active"].get(tech, {})
+    if active.get("lat") and active.get("lon"):
+        return (active["lat"], active["lon"])
+    ref = idx["tech_ref_point"].get(tech, (0.0, 0.0))
+    return ref if ref != (0.0, 0.0) else None
+
+
+def _swap_dist(order: dict, tech: str, point, idx: dict):
+    """Distancia de la orden a la posición del técnico (orden activa / referencia / zona)."""
+    if point is not None and order.get("lat") and order.get("lon"):
+        return haversine(point[0], point[1], order["lat"], order["lon"])
+    return _dist_to_tech(order, tech, idx)
+
+
+def _swap_gain_bound(order: dict, zone_own: str, zone_other: str, subs_other: set,
+                     other_dist_bound: float) -> float:
+    """
+    Cota superior del aporte de una orden al score de intercambio al pasar de su
+    técnico al otro: alineación de zona, subzona compartida y ahorro de distancia.
+    other_dist_bound acota (dist al técnico propio - dist al otro) para órdenes con coords.
+    """
+    zona = order.get("zona", "SIN_ZONA")
+    bound = 900 * (int(zona == zone_other) - int(zona == zone_own))
+    if order["subzona"] in subs_other:
+        bound += 300
+    if order.get("lat") and order.get("lon"):
+        bound += 250 * other_dist_bound
+    else:
+        bound += 250 * 3.5   # fallback por zona: 4.0 - 0.5 km como máximo
+    return bound
+
+
 def _generate_swap_suggestions(orders: list, idx: dict) -> list:
     """
     Genera intercambios A↔B: técnico A cede orden X a técnico B,
@@ -1375,52 +1676,102 @@ def _generate_swap_suggestions(orders: list, idx: dict) -> list:
     - Reducción de desplazamientos totales
     - Menor fragmentación de subzonas
     Solo se sugiere si el beneficio neto supera el umbral mínimo.
+
+    Las órdenes se agrupan por técnico y franja una sola vez, la posición de cada
+    técnico y la distancia de cada orden a su propio técnico se calculan una vez,
+    y se descartan pares de técnicos (por franja) cuya cota superior de score no
+    supera el umbral:
+      score = 900·zone_delta + 300·subz_delta + 250·ahorro
+    con ahorro <= 2·d(posición A, posición B) por desigualdad triangular cuando
+    ambas órdenes tienen coords, y <= 3.5 km por orden con el fallback por zona.
+    El resultado es el mismo top-20 que evaluando todos los pares.
     """
     tech_orders    = idx["tech_orders"]
-    tech_locs      = idx["tech_locs"]
     tech_main_zone = idx["tech_main_zone"]
     tech_subzones  = idx["tech_subzones"]
 
     techs = [t for t in tech_orders if t != "SIN_ASIGNAR"]
 
+    # Órdenes movibles con franja, por técnico y por franja (una vez por ejecución)
     movable_by_tech: dict = {}
+    by_franja: dict = {}
     for t in techs:
-        movable_by_tech[t] = [
+        movable = [
             o for o in tech_orders.get(t, [])
             if o["movible"] and o.get("franja", "Sin Franja") != "Sin Franja"
         ]
+        if not movable:
+            continue
+        movable_by_tech[t] = movable
+        buckets = {}
+        for o in movable:
+            buckets.setdefault(o["franja"], []).append(o)
+        by_franja[t] = buckets
+
+    # Posición de cada técnico y distancia de cada orden a su propio técnico
+    point = {t: _swap_point(t, idx) for t in movable_by_tech}
+    own_dist = {
+        id(o): _swap_dist(o, t, point[t], idx)
+        for t, movable in movable_by_tech.items()
+        for o in movable
+    }
+    str_id = {id(o): str(o["id"]) for movable in movable_by_tech.values() for o in movable}
 
     swaps = []
     seen_pairs: set = set()
 
     for i, tech_a in enumerate(techs):
-        orders_a = movable_by_tech.get(tech_a, [])
+        orders_a = movable_by_tech.get(tech_a)
         if not orders_a:
             continue
         zone_a = tech_main_zone.get(tech_a, "SIN_ZONA")
+        subs_a = tech_subzones.get(tech_a, set())
+        franjas_a = by_franja[tech_a]
+        point_a = point[tech_a]
 
         for tech_b in techs[i + 1:]:
-            orders_b = movable_by_tech.get(tech_b, [])
-            if not orders_b:
+            b_by_franja = by_franja.get(tech_b)
+            if not b_by_franja:
                 continue
             zone_b = tech_main_zone.get(tech_b, "SIN_ZONA")
+            subs_b = tech_subzones.get(tech_b, set())
+            point_b = point[tech_b]
 
-            b_by_franja: dict = {}
-            for o in orders_b:
-                b_by_franja.setdefault(o["franja"], []).append(o)
+            # Cota de ahorro por orden con coords: d(posición A, posición B)
+            if point_a is not None and point_b is not None:
+                dist_ab = haversine(point_a[0], point_a[1], point_b[0], point_b[1])
+            else:
+                dist_ab = float("inf")
+
+            # Poda: franjas compartidas cuya mejor combinación no puede superar el umbral
+            viables = set()
+            for franja, xs in franjas_a.items():
+                ys = b_by_franja.get(franja)
+                if not ys:
+                    continue
+                bound = (
+                    max(_swap_gain_bound(x, zone_a, zone_b, subs_b, dist_ab) for x in xs)
+                    + max(_swap_gain_bound(y, zone_b, zone_a, subs_a, dist_ab) for y in ys)
+                )
+                if bound > 50 - 1e-6:
+                    viables.add(franja)
+            if not viables:
+                continue
 
             for order_x in orders_a:
                 franja = order_x["franja"]
-                candidates_y = b_by_franja.get(franja, [])
-                if not candidates_y:
+                if franja not in viables:
                     continue
+                candidates_y = b_by_franja[franja]
                 zone_x = order_x.get("zona", "SIN_ZONA")
+                sub_x  = order_x["subzona"]
+                id_x   = str_id[id(order_x)]
+                dist_xa = own_dist[id(order_x)]
+                dist_xb = None
 
                 for order_y in candidates_y:
-                    pair_key = (
-                        min(str(order_x["id"]), str(order_y["id"])),
-                        max(str(order_x["id"]), str(order_y["id"])),
-                    )
+                    id_y = str_id[id(order_y)]
+                    pair_key = (min(id_x, id_y), max(id_x, id_y))
                     if pair_key in seen_pairs:
                         continue
 
@@ -1430,66 +1781,25 @@ def _generate_swap_suggestions(orders: list, idx: dict) -> list:
                     align_after  = int(zone_x == zone_b) + int(zone_y == zone_a)
                     zone_delta   = align_after - align_before
 
-                    subs_a = tech_subzones.get(tech_a, set())
-                    subs_b = tech_subzones.get(tech_b, set())
-                    subs_a_after = (subs_a - {order_x["subzona"]}) | {order_y["subzona"]}
-                    subs_b_after = (subs_b - {order_y["subzona"]}) | {order_x["subzona"]}
-                    subz_delta   = (len(subs_a) + len(subs_b)) - (len(subs_a_after) + len(subs_b_after))
+                    # Igual a comparar |subs| antes/después de cambiar una subzona por otra
+                    sub_y = order_y["subzona"]
+                    if sub_x == sub_y:
+                        subz_delta = 0
+                    else:
+                        subz_delta = int(sub_y in subs_a) + int(sub_x in subs_b)
 
-                    # Usar posición de la orden activa (En sitio/Iniciado) como referencia
+                    # Posición de la orden activa (En sitio/Iniciado) como referencia
                     # para calcular el ahorro real de desplazamiento del intercambio
-                    active_a = _get_active_order(tech_a, tech_orders)
-                    active_b = _get_active_order(tech_b, tech_orders)
-
-                    def dist_from_active(order, active, tech, locs):
-                        if active.get("lat") and active.get("lon") and order.get("lat") and order.get("lon"):
-                            return haversine(active["lat"], active["lon"], order["lat"], order["lon"])
-                        return _dist_to_tech(order, tech, tech_orders, locs)
-
-                    dist_xa = dist_from_active(order_x, active_a, tech_a, tech_locs)
-                    dist_yb = dist_from_active(order_y, active_b, tech_b, tech_locs)
-                    dist_xb = dist_from_active(order_x, active_b, tech_b, tech_locs)
-                    dist_ya = dist_from_active(order_y, active_a, tech_a, tech_locs)
+                    if dist_xb is None:
+                        dist_xb = _swap_dist(order_x, tech_b, point_b, idx)
+                    dist_yb = own_dist[id(order_y)]
+                    dist_ya = _swap_dist(order_y, tech_a, point_a, idx)
 
                     has_coords = all(d is not None for d in [dist_xa, dist_yb, dist_xb, dist_ya])
                     dist_saving = 0.0
                     if has_coords:
                         dist_saving = (dist_xa + dist_yb) - (dist_xb + dist_ya)
 
-                    # Verificar compatibilidad de franja para el intercambio
-                    franja_x = order_x["franja"]
-                    franja_y = order_y["franja"]
-                    franja_same = franja_x == franja_y
-
-                    if not franja_same:
-                        # Intercambio cross-franja: solo si ambos técnicos son compatibles
-                        # con la franja del otro (respeto de turno)
-                        tech_turno_map = idx.get("tech_turno", {})
-                        turno_a = tech_turno_map.get(tech_a, detect_turno(tech_a, tech_orders.get(tech_a, [])))
-                        turno_b = tech_turno_map.get(tech_b, detect_turno(tech_b, tech_orders.get(tech_b, [])))
-                        fx_start, _ = parse_franja_hours(franja_x)
-                        fy_start, _ = parse_franja_hours(franja_y)
-                        fx_start = fx_start or 0.0
-                        fy_start = fy_start or 0.0
-                        # tech_b recibe order_x (franja_x) — valid?
-                        if fx_start >= 16.0 and turno_b == "T1":
-                            continue
-                        if fx_start < 9.5 and turno_b == "T2":
-                            continue
-                        if 9.9 <= fx_start <= 10.1 and turno_b == "T2":
-                            cur = idx["tech_franja"].get(tech_b, {}).get(franja_x, 0)
-                            if cur >= T2_MAX_ORDERS_10H_SLOT:
-                                continue
-                        # tech_a recibe order_y (franja_y) — valid?
-                        if fy_start >= 16.0 and turno_a == "T1":
-                            continue
-                        if fy_start < 9.5 and turno_a == "T2":
-                            continue
-                        if 9.9 <= fy_start <= 10.1 and turno_a == "T2":
-                            cur = idx["tech_franja"].get(tech_a, {}).get(franja_y, 0)
-                            if cur >= T2_MAX_ORDERS_10H_SLOT:
-                                continue
-
                     score = zone_delta * 900 + subz_delta * 300 + dist_saving * 250
                     if score <= 50:
                         continue
@@ -1545,81 +1855,373 @@ def _generate_swap_suggestions(orders: list, idx: dict) -> list:
     return swaps[:20]
 
 
+# ─── Generación paralela por grupo de zonas ───
+
+_executor = None
+
+
+def _zone_groups() -> dict:
+    """
+    zona -> nombre del grupo conexo de ZONE_ADJACENCY al que pertenece.
+    Las zonas sin vecinos (RIONEGRO) forman su propio grupo.
+    """
+    groups = {}
+    for zona in ZONE_ADJACENCY:
+        if zona in groups:
+            continue
+        pending = [zona]
+        while pending:
+            z = pending.pop()
+            if z in groups:
+                continue
+            groups[z] = zona
+            pending.extend(ZONE_ADJACENCY.get(z, []))
+            pending.extend(k for k, vecinas in ZONE_ADJACENCY.items() if z in vecinas)
+    return groups
+
+
+def _partition_by_zone_group(orders: list, idx: dict) -> list:
+    """
+    Reparte las órdenes por grupo de zonas: cada técnico va completo con su zona
+    principal; las órdenes sin técnico van con la zona de la orden.
+    Zonas fuera de ZONE_ADJACENCY (SIN_ZONA, otras ciudades) forman grupo propio.
+    """
+    groups = _zone_groups()
+    parts = {}
+    for o in orders:
+        tech = o["tecnico"]
+        if tech != "SIN_ASIGNAR":
+            zona = idx["tech_main_zone"].get(tech, "SIN_ZONA")
+        else:
+            zona = o["zona"] if o["zona"] != "SIN_ZONA" else o.get("ciudad", "SIN_ZONA") or "SIN_ZONA"
+        parts.setdefault(groups.get(zona, zona), []).append(o)
+    return list(parts.values())
+
+
+def _suggest_partition(orders: list, current_hour: float) -> tuple:
+    """Índices y los tres generadores de sugerencias para un grupo de zonas (corre en un proceso hijo)."""
+    idx = _build_indexes(orders)
+    return (
+        _generate_suggestions(orders, idx, current_hour),
+        _generate_route_suggestions(orders, idx),
+        _generate_swap_suggestions(orders, idx),
+    )
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # forkserver: los hijos no heredan locks tomados por otros hilos del
+        # worker de gunicorn (_incremental_lock, logging) como con fork
+        _executor = ProcessPoolExecutor(
+            max_workers=PARALLEL_LEVELING_WORKERS or None,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _executor
+
+
+def _generate_suggestions_parallel(orders: list, idx: dict, current_hour: float):
+    """
+    Ejecuta _suggest_partition por grupo de zonas en un ProcessPoolExecutor y une
+    los resultados con los mismos topes que el modo serie (50 / 10 / 20).
+    Devuelve None si hay un solo grupo o el pool falla por cualquier motivo
+    (pool roto, pickling, excepción en un hijo): el llamador sigue en serie.
+    """
+    global _executor
+    parts = _partition_by_zone_group(orders, idx)
+    if len(parts) < 2:
+        return None
+    try:
+        executor = _get_executor()
+        results = list(executor.map(_suggest_partition, parts, [current_hour] * len(parts)))
+    except Exception as exc:
+        logger.warning("Nivelación paralela no disponible, se usa modo serie: %s", exc)
+        if isinstance(exc, (BrokenProcessPool, OSError)):
+            _executor = None   # el pool no se puede reutilizar
+        return None
+
+    suggestions, routes, swaps = [], [], []
+    for sugs_p, routes_p, swaps_p in results:
+        suggestions.extend(sugs_p)
+        routes.extend(routes_p)
+        swaps.extend(swaps_p)
+    suggestions.sort(key=lambda x: x["score"], reverse=True)
+    routes.sort(key=lambda x: x["score"], reverse=True)
+    swaps.sort(key=lambda x: x["score"], reverse=True)
+    return suggestions[:50], routes[:10], swaps[:20]
+
+
+# ─── Modo incremental ────────────────────────
+
+# Estado de la última ejecución incremental: órdenes normalizadas por hash de
+# contenido, derivados por técnico y (dist, score) de los pares orden×receptor.
+_incremental_state = {"norm": {}, "ids": {}, "derived": {}, "scores": {}}
+_incremental_lock = threading.Lock()
+
+
+def _content_hash(raw: dict) -> str:
+    """Hash estable del contenido de una fila cruda (independiente del orden de columnas)."""
+    payload = repr(sorted(raw.items(), key=lambda kv: str(kv[0])))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _normalize_incremental(raw_orders: list, state: dict) -> list:
+    """
+    Normaliza reutilizando las órdenes de la ejecución anterior cuyo contenido
+    no cambió. Cada orden normalizada queda marcada con su "_hash".
+    """
+    prev_norm = state["norm"]
+    prev_ids  = state["ids"]
+    norm, ids = {}, {}
+    orders = []
+    for raw in raw_orders:
+        h = _content_hash(raw)
+        o = norm.get(h)
+        if o is not None:
+            o = dict(o)  # fila repetida en el mismo export: copia independiente
+        else:
+            o = prev_norm.get(h)
+            if o is None:
+                o = normalize_order(raw)
+                o["_hash"] = h
+            norm[h] = o
+        ids[o.get("id")] = h
+        orders.append(o)
+
+    nuevas      = sum(1 for oid in ids if oid not in prev_ids)
+    modificadas = sum(1 for oid, h in ids.items() if oid in prev_ids and prev_ids[oid] != h)
+    eliminadas  = sum(1 for oid in prev_ids if oid not in ids)
+    logger.info(
+        "Nivelación incremental: %s órdenes | nuevas=%s modificadas=%s eliminadas=%s",
+        len(orders), nuevas, modificadas, eliminadas,
+    )
+    state["norm"] = norm
+    state["ids"]  = ids
+    return orders
+
+
+# ─── Resultado con secciones perezosas ───────
+
+class LazyResult(dict):
+    """
+    dict cuyas secciones costosas se calculan al primer acceso y quedan
+    memoizadas. Se comporta como un dict normal (get, in, items, ** y
+    serialización JSON resuelven lo pendiente); cheap() entrega una copia
+    plana sin disparar las claves indicadas.
+
+    Seguro entre hilos: _lock protege por tramos cortos el dict y _lazy (las
+    lecturas toman una foto de ambos); _calc_lock serializa los cálculos, que
+    corren fuera de _lock para no bloquear a los lectores.
+    """
+
+    def __init__(self, data=None, lazy=None):
+        super().__init__(data or {})
+        self._lazy = {}
+        self._lock = threading.RLock()
+        self._calc_lock = threading.RLock()
+        if lazy:
+            self.defer(lazy)
+
+    def defer(self, lazy: dict):
+        """Registra secciones {key: fn()} a calcular en el primer acceso."""
+        with self._lock:
+            self._lazy.update(lazy)
+
+    def _snapshot(self) -> tuple:
+        """(claves ya calculadas, claves pendientes) tomadas juntas bajo el lock."""
+        with self._lock:
+            calculadas = list(dict.keys(self))
+            pendientes = [k for k in self._lazy if not dict.__contains__(self, k)]
+        return calculadas, pendientes
+
+    def pending(self) -> list:
+        return self._snapshot()[1]
+
+    def __missing__(self, key):
+        with self._calc_lock:
+            with self._lock:
+                if dict.__contains__(self, key):
+                    return dict.__getitem__(self, key)
+                fn = self._lazy.get(key)
+            if fn is None:
+                raise KeyError(key)
+            value = fn()
+            with self._lock:
+                dict.__setitem__(self, key, value)
+                self._lazy.pop(key, None)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __contains__(self, key):
+        with self._lock:
+            return dict.__contains__(self, key) or key in self._lazy
+
+    def __len__(self):
+        calculadas, pendientes = self._snapshot()
+        return len(calculadas) + len(pendientes)
+
+    def keys(self):
+        calculadas, pendientes = self._snapshot()
+        return calculadas + pendientes
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def cheap(self, skip=()) -> dict:
+        """Copia plana: resuelve lo pendiente salvo las claves de skip aún sin calcular (None)."""
+        calculadas, pendientes = self._snapshot()
+        out = {}
+        for k in calculadas + pendientes:
+            if k in skip and k in pendientes:
+                out[k] = None
+            else:
+                v = self[k]
+                out[k] = v.cheap(skip) if isinstance(v, LazyResult) else v
+        return out
+
+
 # ─── Punto de entrada principal ──────────────
 
-def run_leveling(raw_orders: list) -> dict:
+def run_leveling(raw_orders: list, incremental: bool = False,
+                 parallel: bool = False) -> dict:
     """
-    Recibe una lista de dicts (de Metabase o Excel),
+    Recibe una lista o un iterable de dicts (de Metabase o Excel),
     ejecuta el motor completo y devuelve el JSON de nivelación.
+    Con incremental=True compara contra la ejecución anterior por id y hash de
+    contenido: reutiliza las órdenes normalizadas sin cambios, los derivados de
+    los técnicos cuyas órdenes no cambiaron y los scores de los pares orden×receptor
+    que no tocan técnicos afectados. El resultado es idéntico al de un recálculo completo.
+    Con parallel=True las sugerencias, rutas e intercambios se generan por grupo de
+    zonas conexas en procesos separados (sin movimientos entre grupos).
     """
+    if not incremental:
+        return _run_leveling(raw_orders, None, parallel)
+    with _incremental_lock:
+        return _run_leveling(raw_orders, _incremental_state, parallel)
+
+
+def _run_leveling(raw_orders: list, state: dict, parallel: bool = False) -> LazyResult:
     now_dt    = now_bogota()
     now_hour  = now_dt.hour + now_dt.minute / 60.0
 
-    if not raw_orders:
+    # raw_orders puede ser una lista o un generador (ingesta en streaming):
+    # se revisa la primera fila sin materializar el resto
+    rows  = iter(raw_orders)
+    first = next(rows, None)
+    if first is None:
         return _empty_result("Sin datos. Configura Metabase o sube un archivo.")
+    raw_orders = chain((first,), rows)
 
-    # 1. Normalizar
-    orders = [normalize_order(o) for o in raw_orders]
+    # 1. Normalizar (cada fila se normaliza a medida que llega)
+    if state is not None:
+        orders = _normalize_incremental(raw_orders, state)
+    else:
+        orders = [normalize_order(o) for o in raw_orders]
 
     # 2. Construir índices
-    idx = _build_indexes(orders)
+    idx = _build_indexes(orders, state["derived"] if state is not None else None)
 
     # 3. Clasificar órdenes
     movibles   = [o for o in orders if o["movible"]]
     bloqueadas = [o for o in orders if not o["movible"]]
 
-    # 4. Alertas
-    alerts = _generate_alerts(orders, idx, now_dt)
-
-    # 5. Sugerencias individuales
-    suggestions = _generate_suggestions(orders, idx, now_hour)
-
-    # 5b. Rutas completas para técnicos con capacidad disponible
-    route_suggestions = _generate_route_suggestions(orders, idx)
-
-    # 5c. Intercambios bidireccionales (A↔B misma franja)
-    swap_suggestions = _generate_swap_suggestions(orders, idx)
+    if state is not None:
+        state["derived"] = idx["derived_cache"]
+
+    # 4-6. Secciones perezosas: alertas, sugerencias, rutas, intercambios y carga
+    # por técnico se calculan al primer acceso y quedan memoizadas en el resultado.
+    result = LazyResult()
+
+    def _alertas():
+        return _generate_alerts(orders, idx, now_dt)
+
+    def _sugerencias_serie():
+        # 5. Sugerencias individuales
+        if state is None:
+            return _generate_suggestions(orders, idx, now_hour)
+        # Los scores memoizados son por contenido (hash de orden + huellas de
+        # técnicos): sirven aunque otra ejecución haya actualizado el estado
+        with _incremental_lock:
+            memo = {"prev": state["scores"], "next": {}}
+        suggestions = _generate_suggestions(orders, idx, now_hour, memo)
+        with _incremental_lock:
+            state["scores"] = memo["next"]
+        return suggestions
+
+    # 5-5c. Modo paralelo opcional: un proceso por grupo de zonas conexas;
+    # las tres secciones salen juntas de la misma corrida
+    bundle = {}
+
+    def _bundle():
+        if "v" not in bundle:
+            res = _generate_suggestions_parallel(orders, idx, now_hour)
+            if res is None:
+                res = (_sugerencias_serie(), _generate_route_suggestions(orders, idx),
+                       _generate_swap_suggestions(orders, idx))
+            bundle["v"] = res
+        return bundle["v"]
+
+    def _sugerencias():
+        return _bundle()[0] if parallel else _sugerencias_serie()
+
+    def _rutas():
+        # 5b. Rutas completas para técnicos con capacidad disponible
+        return _bundle()[1] if parallel else _generate_route_suggestions(orders, idx)
+
+    def _intercambios():
+        # 5c. Intercambios bidireccionales (A↔B misma franja)
+        return _bundle()[2] if parallel else _generate_swap_suggestions(orders, idx)
 
     # 6. Carga por técnico
-    carga_por_tecnico = []
-    for tech, t_orders in sorted(idx["tech_orders"].items()):
-        total = len(t_orders)
-        movibles_t = sum(1 for o in t_orders if o["movible"])
-        bloq_t     = total - movibles_t
-        activas_t  = sum(1 for o in t_orders if 1 <= o.get("progress", 0) < 6)
-        fin_t      = sum(1 for o in t_orders if o.get("progress", 0) >= 6)
-        sobrecarga = total > MAX_IDEAL_LOAD
-        franja_map = idx["tech_franja"].get(tech, {})
-        subzones   = list(idx["tech_subzones"].get(tech, set()))
-        # Desglose por estado específico
-        por_estado = {}
-        for o in t_orders:
-            est = str(o.get("estado", "desconocido")).strip().lower()
-            por_estado[est] = por_estado.get(est, 0) + 1
-        zona_display = idx["tech_main_zone"].get(tech, "SIN_ZONA")
-        if zona_display == "SIN_ZONA":
-            # Fallback: usar ciudad de la primera orden del técnico
-            for _o in t_orders:
-                _c = _o.get("ciudad", "") or ""
-                if _c and _c.upper() not in ("SIN_ZONA", ""):
-                    zona_display = _c.upper(); break
-        turno_t = idx.get("tech_turno", {}).get(tech, "T1")
-        shift_end_t = idx.get("tech_shift_end", {}).get(tech, T1_END_HOUR)
-        carga_por_tecnico.append({
-            "tecnico":    tech,
-            "zona":       zona_display,
-            "turno":      turno_t,
-            "shift_end":  f"{int(shift_end_t):02d}:{int((shift_end_t % 1)*60):02d}",
-            "total":      total,
-            "movibles":   movibles_t,
-            "bloqueadas": bloq_t,
-            "activas":    activas_t,
-            "finalizadas":fin_t,
-            "sobrecarga": sobrecarga,
-            "franjas":    franja_map,
-            "subzonas":   subzones,
-            "por_estado": por_estado,
-        })
+    def _carga_por_tecnico():
+        carga_por_tecnico = []
+        for tech, t_orders in sorted(idx["tech_orders"].items()):
+            total = len(t_orders)
+            movibles_t = sum(1 for o in t_orders if o["movible"])
+            bloq_t     = total - movibles_t
+            activas_t  = sum(1 for o in t_orders if 1 <= o.get("progress", 0) < 6)
+            fin_t      = sum(1 for o in t_orders if o.get("progress", 0) >= 6)
+            sobrecarga = total > MAX_IDEAL_LOAD
+            franja_map = idx["tech_franja"].get(tech, {})
+            subzones   = list(idx["tech_subzones"].get(tech, set()))
+            # Desglose por estado específico
+            por_estado = {}
+            for o in t_orders:
+                est = str(o.get("estado", "desconocido")).strip().lower()
+                por_estado[est] = por_estado.get(est, 0) + 1
+            zona_display = idx["tech_main_zone"].get(tech, "SIN_ZONA")
+            if zona_display == "SIN_ZONA":
+                # Fallback: usar ciudad de la primera orden del técnico
+                for _o in t_orders:
+                    _c = _o.get("ciudad", "") or ""
+                    if _c and _c.upper() not in ("SIN_ZONA", ""):
+                        zona_display = _c.upper(); break
+            turno_t = idx.get("tech_turno", {}).get(tech, "T1")
+            shift_end_t = idx.get("tech_shift_end", {}).get(tech, T1_END_HOUR)
+            carga_por_tecnico.append({
+                "tecnico":    tech,
+                "zona":       zona_display,
+                "turno":      turno_t,
+                "shift_end":  f"{int(shift_end_t):02d}:{int((shift_end_t % 1)*60):02d}",
+                "total":      total,
+                "movibles":   movibles_t,
+                "bloqueadas": bloq_t,
+                "activas":    activas_t,
+                "finalizadas":fin_t,
+                "sobrecarga": sobrecarga,
+                "franjas":    franja_map,
+                "subzonas":   subzones,
+                "por_estado": por_estado,
+            })
+        return carga_por_tecnico
 
     # 7. Carga por franja
     from config import FRANJAS
@@ -1668,60 +2270,61 @@ def run_leveling(raw_orders: list) -> dict:
             "lon":         o.get("lon", 0),
         }
 
-    # 9. Resumen
-    alerta_critica      = sum(1 for a in alerts if a.get("severidad") in ("critica", "alta"))
-    alerta_muy_alta     = sum(1 for a in alerts if a.get("severidad") == "muy_alta")
-    techs_sobrecargados = sum(1 for c in carga_por_tecnico if c["sobrecarga"] and c["tecnico"] != "SIN_ASIGNAR")
+    # 9. Resumen: los conteos que dependen de secciones perezosas también lo son
+    def _alert_counts(pred):
+        return lambda: sum(1 for a in result["alertas"] if pred(a))
+
+    def _carga_counts(pred):
+        return lambda: sum(1 for c in result["carga_por_tecnico"]
+                           if pred(c) and c["tecnico"] != "SIN_ASIGNAR")
+
     techs_con_capacidad = sum(1 for t, total in idx["tech_total"].items() if t != "SIN_ASIGNAR" and total < MAX_IDEAL_LOAD)
     techs_deficitarios  = sum(1 for t, total in idx["tech_total"].items() if t != "SIN_ASIGNAR" and total < MIN_IDEAL_LOAD)
-    techs_t1            = sum(1 for c in carga_por_tecnico if c.get("turno") == "T1" and c["tecnico"] != "SIN_ASIGNAR")
-    techs_t2            = sum(1 for c in carga_por_tecnico if c.get("turno") == "T2" and c["tecnico"] != "SIN_ASIGNAR")
-    techs_alcanzados    = sum(1 for a in alerts if a.get("tipo") == "ALCANZADO")
-    # Técnicos sin marcar en franja activa (para resumen ejecutivo)
-    techs_sin_marcacion = len(set(
-        a["tecnico"] for a in alerts
-        if a.get("tipo") in ("FRANJA_ACTIVA_SIN_MARCACION", "RIESGO_INCUMPLIMIENTO_FRANJA")
-    ))
-    alertas_riesgo_franja = sum(
-        1 for a in alerts if a.get("tipo") == "RIESGO_INCUMPLIMIENTO_FRANJA"
-    )
 
-    return {
-        "generado_en": now_dt.strftime("%Y-%m-%d %H:%M:%S"),
-        "resumen": {
-            "total_ordenes":          len(orders),
-            "movibles":               len(movibles),
-            "bloqueadas":             len(bloqueadas),
-            "alertas":                len(alerts),
-            "alertas_criticas":       alerta_critica,
-            "alertas_muy_altas":      alerta_muy_alta,
-            "alertas_riesgo_franja":  alertas_riesgo_franja,
-            "tecnicos_sin_marcacion": techs_sin_marcacion,
-            "sugerencias":            len(suggestions),
-            "intercambios":           len(swap_suggestions),
-            "rutas_sugeridas":         len(route_suggestions),
-            "tecnicos_total":         len([t for t in idx["tech_orders"] if t != "SIN_ASIGNAR"]),
-            "tecnicos_sobrecargados": techs_sobrecargados,
-            "tecnicos_con_capacidad": techs_con_capacidad,
-            "tecnicos_deficitarios":  techs_deficitarios,
-            "tecnicos_t1":            techs_t1,
-            "tecnicos_t2":            techs_t2,
-            "tecnicos_alcanzados":    techs_alcanzados,
-            "sin_tecnico":            sum(1 for o in movibles if o["tecnico"] == "SIN_ASIGNAR"),
-            "sin_franja":             sum(1 for o in movibles if o["franja"] == "Sin Franja"),
-            "sin_franja":             sum(1 for o in movibles if o["franja"] == "Sin Franja"),
-            "objetivo_por_tecnico":   f"{MIN_IDEAL_LOAD}-{MAX_IDEAL_LOAD} ordenes",
-        },
-        "carga_por_tecnico": carga_por_tecnico,
+    resumen = LazyResult({
+        "total_ordenes":          len(orders),
+        "movibles":               len(movibles),
+        "bloqueadas":             len(bloqueadas),
+        "tecnicos_total":         len([t for t in idx["tech_orders"] if t != "SIN_ASIGNAR"]),
+        "tecnicos_con_capacidad": techs_con_capacidad,
+        "tecnicos_deficitarios":  techs_deficitarios,
+        "sin_tecnico":            sum(1 for o in movibles if o["tecnico"] == "SIN_ASIGNAR"),
+        "sin_franja":             sum(1 for o in movibles if o["franja"] == "Sin Franja"),
+        "objetivo_por_tecnico":   f"{MIN_IDEAL_LOAD}-{MAX_IDEAL_LOAD} ordenes",
+    }, {
+        "alertas":                lambda: len(result["alertas"]),
+        "alertas_criticas":       _alert_counts(lambda a: a.get("severidad") in ("critica", "alta")),
+        "alertas_muy_altas":      _alert_counts(lambda a: a.get("severidad") == "muy_alta"),
+        "alertas_riesgo_franja":  _alert_counts(lambda a: a.get("tipo") == "RIESGO_INCUMPLIMIENTO_FRANJA"),
+        # Técnicos sin marcar en franja activa (para resumen ejecutivo)
+        "tecnicos_sin_marcacion": lambda: len(set(
+            a["tecnico"] for a in result["alertas"]
+            if a.get("tipo") in ("FRANJA_ACTIVA_SIN_MARCACION", "RIESGO_INCUMPLIMIENTO_FRANJA")
+        )),
+        "tecnicos_alcanzados":    _alert_counts(lambda a: a.get("tipo") == "ALCANZADO"),
+        "tecnicos_sobrecargados": _carga_counts(lambda c: c["sobrecarga"]),
+        "tecnicos_t1":            _carga_counts(lambda c: c.get("turno") == "T1"),
+        "tecnicos_t2":            _carga_counts(lambda c: c.get("turno") == "T2"),
+        "sugerencias":            lambda: len(result["sugerencias"]),
+        "intercambios":           lambda: len(result["intercambios"]),
+        "rutas_sugeridas":        lambda: len(result["rutas_sugeridas"]),
+    })
+
+    result.update({
+        "generado_en":       now_dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "resumen":           resumen,
         "carga_por_franja":  carga_por_franja,
         "ordenes_movibles":  [enrich_order(o) for o in movibles],
         "ordenes_bloqueadas":[enrich_order(o) for o in bloqueadas],
-        "alertas":           alerts,
-        "sugerencias":       suggestions,
-        "intercambios":      swap_suggestions,
-        "rutas_sugeridas":    route_suggestions,
-    }
-
+    })
+    result.defer({
+        "carga_por_tecnico": _carga_por_tecnico,
+        "alertas":           _alertas,
+        "sugerencias":       _sugerencias,
+        "intercambios":      _intercambios,
+        "rutas_sugeridas":   _rutas,
+    })
+    return result
 
 def _empty_result(msg: str) -> dict:
     return {
@@ -1,7 +1,17 @@
 """services/normalization.py - Normalizacion de estados, franjas, zonas y coordenadas"""
 import re, math
+from collections import namedtuple
+from functools import lru_cache
+from operator import itemgetter
 from config import (MOVABLE_STATUSES,BLOCKED_STATUSES,NEAR_FINISH_STATUSES,
     FINALIZED_STATUSES,STATUS_PROGRESS,FRANJAS,NEARBY_BUILDING_RADIUS_KM)
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
  
 def norm_text(x,default=""): return str(x).strip() if x is not None else default
 def norm_upper(x,default="SIN_VALOR"):
@@ -37,37 +47,75 @@ def parse_franja_hours(franja_str):
         s,e=pt(parts[0]),pt(parts[1])
         return (s,e) if s is not None and e is not None else (None,None)
     except: return None,None
-def classify_status(estado):
-    s=norm_status(estado)
+# ── Registro compilado de estados ────────────────────────────────────────────
+# Cada estado crudo se resuelve UNA vez (memoizado) a un StatusInfo con código,
+# clase, progreso, peso y crédito; las reglas del motor ramifican sobre el
+# código (máscara de bits) en vez de repetir búsquedas de subcadenas por orden.
+ST_EN_SITIO   = 1 << 0
+ST_INICIADO   = 1 << 1   # iniciado / iniciada / trabajando
+ST_EN_CAMINO  = 1 << 2
+ST_CANCELADO  = 1 << 3
+ST_ACTIVO     = ST_EN_SITIO | ST_INICIADO
+_CLOSED_KEYS  = ("finaliz","por auditar","cerrad","completad")
+StatusInfo = namedtuple("StatusInfo","code clase progress weight credit norm")
+def _classify_norm(s):
     if any(m in s for m in MOVABLE_STATUSES): return "movible"
     if any(f in s for f in FINALIZED_STATUSES): return "finalizado"
     if any(n in s for n in NEAR_FINISH_STATUSES): return "avanzado"
     if any(b in s for b in BLOCKED_STATUSES): return "bloqueado"
     return "desconocido"
-def is_movable(estado): return classify_status(estado)=="movible"
-def is_blocked(estado): return classify_status(estado) in ("bloqueado","avanzado","finalizado")
-def get_status_progress(estado):
-    s=norm_status(estado)
+def _progress_norm(s):
     for k,v in STATUS_PROGRESS.items():
         if k in s: return v
     return 0
-def status_effective_weight(estado):
-    s=norm_status(estado)
+def _weight_norm(s,progress):
     if "cancelad" in s: return 0.35
-    if any(k in s for k in ["finaliz","por auditar","cerrad","completad"]): return 0.05
+    if any(k in s for k in _CLOSED_KEYS): return 0.05
     if any(k in s for k in NEAR_FINISH_STATUSES): return 0.65
-    if get_status_progress(s)>=1: return 1.25
+    if progress>=1: return 1.25
     if any(k in s for k in MOVABLE_STATUSES): return 1.05
     return 0.95
-def status_completion_credit(estado):
-    s=norm_status(estado)
-    if any(k in s for k in ["finaliz","por auditar","cerrad","completad"]): return 1.0
+def _credit_norm(s):
+    if any(k in s for k in _CLOSED_KEYS): return 1.0
     if "cancelad" in s: return 0.25
     return 0.0
+@lru_cache(maxsize=1024)
+def _compile_status(estado):
+    s=norm_status(estado); low=estado.lower(); code=0
+    if "en sitio" in low: code|=ST_EN_SITIO
+    if any(k in low for k in ("iniciado","iniciada","trabajando")): code|=ST_INICIADO
+    if "en camino" in low: code|=ST_EN_CAMINO
+    if "cancel" in low: code|=ST_CANCELADO
+    progress=_progress_norm(s)
+    return StatusInfo(code,_classify_norm(s),progress,_weight_norm(s,progress),_credit_norm(s),s)
+def status_info(estado):
+    """StatusInfo memoizado del estado crudo (code, clase, progress, weight, credit, norm)."""
+    return _compile_status(estado if isinstance(estado,str) else norm_text(estado,"por programar"))
+def classify_status(estado): return status_info(estado).clase
+def is_movable(estado): return classify_status(estado)=="movible"
+def is_blocked(estado): return classify_status(estado) in ("bloqueado","avanzado","finalizado")
+def get_status_progress(estado): return status_info(estado).progress
+def status_effective_weight(estado): return status_info(estado).weight
+def status_completion_credit(estado): return status_info(estado).credit
 def haversine(lat1,lon1,lat2,lon2):
     R=6371.0; dlat=math.radians(lat2-lat1); dlon=math.radians(lon2-lon1)
     a=math.sin(dlat/2)**2+math.cos(math.radians(lat1))*math.cos(math.radians(lat2))*math.sin(dlon/2)**2
     return R*2*math.atan2(math.sqrt(a),math.sqrt(1-a))
+def haversine_matrix(points_a,points_b):
+    """
+    Matriz de distancias haversine (km) entre dos listas de (lat, lon):
+    fila i = points_a[i], columna j = points_b[j]. Devuelve listas anidadas de float.
+    Con NumPy se calcula en un solo lote con la misma fórmula que haversine();
+    sin NumPy cae al cálculo escalar par a par.
+    """
+    if not points_a or not points_b: return [[] for _ in points_a]
+    if not HAS_NUMPY:
+        return [[haversine(a[0],a[1],b[0],b[1]) for b in points_b] for a in points_a]
+    pa=np.asarray(points_a,dtype=float); pb=np.asarray(points_b,dtype=float)
+    lat1=pa[:,0][:,None]; lon1=pa[:,1][:,None]; lat2=pb[:,0][None,:]; lon2=pb[:,1][None,:]
+    R=6371.0; dlat=np.radians(lat2-lat1); dlon=np.radians(lon2-lon1)
+    a=np.sin(dlat/2)**2+np.cos(np.radians(lat1))*np.cos(np.radians(lat2))*np.sin(dlon/2)**2
+    return (R*2*np.arctan2(np.sqrt(a),np.sqrt(1-a))).tolist()
 def get_centroid(locs):
     if not locs: return(0.0,0.0)
     lats=[l[0] for l in locs if l[0]]; lons=[l[1] for l in locs if l[1]]
@@ -116,25 +164,61 @@ _COL_ALIASES = {
     "sites":        ["sites","site","sitio"],
 }
  
+@lru_cache(maxsize=64)
+def _compile_key_plan(keys):
+    """
+    Compila, una vez por conjunto de keys, el plan (interno, key original)
+    que aplica _COL_ALIASES; filas con el mismo esquema reutilizan el plan.
+    """
+    lowered={}
+    for k in keys: lowered[str(k).strip().lower()]=k
+    plan=[]
+    for internal,candidates in _COL_ALIASES.items():
+        for c in candidates:
+            if c.lower() in lowered:
+                plan.append((internal,lowered[c.lower()]))
+                break
+    return tuple(plan)
+
 def _normalize_col_keys(row: dict) -> dict:
     """
     Devuelve un nuevo dict con keys normalizadas al esquema interno.
     Las keys no reconocidas se conservan tal cual.
-    Opera en O(n*m) pero n<20 y m<10 en la práctica.
     """
-    lowered = {str(k).strip().lower(): v for k, v in row.items()}
     result = dict(row)  # empieza con los originales
-    for internal, candidates in _COL_ALIASES.items():
-        for c in candidates:
-            if c.lower() in lowered:
-                val = lowered[c.lower()]
-                if val is not None and str(val).strip() not in ("", "None", "nan"):
-                    result[internal] = val
-                elif internal not in result or result.get(internal) is None:
-                    result[internal] = val
-                break
+    for internal, k in _compile_key_plan(tuple(row)):
+        val = row[k]
+        if val is not None and str(val).strip() not in ("", "None", "nan"):
+            result[internal] = val
+        elif internal not in result or result.get(internal) is None:
+            result[internal] = val
     return result
- 
+
+def compile_header(header, aliases=None):
+    """
+    Compila un header tabular (una vez por archivo) a un extractor posicional.
+    Retorna (fields, cols, extract):
+      fields  — campos internos en el orden de aliases
+      cols    — {campo: índice} solo de las columnas encontradas
+      extract — extract(row) -> tupla alineada con fields (None si la columna
+                no existe o la fila viene más corta que el header)
+    """
+    aliases = aliases or _COL_ALIASES
+    hl = [str(h).strip().lower() if h is not None else "" for h in header]
+    pos = {}
+    for i, h in enumerate(hl): pos.setdefault(h, i)
+    width = len(hl); need = width + 1   # índice width = relleno None
+    fields, idxs, cols = tuple(aliases), [], {}
+    for field, candidates in aliases.items():
+        i = next((pos[c.lower()] for c in candidates if c.lower() in pos), width)
+        idxs.append(i)
+        if i < width: cols[field] = i
+    getter = itemgetter(*idxs) if len(idxs) > 1 else (lambda r, i=idxs[0]: (r[i],))
+    def extract(row):
+        if len(row) < need: row = tuple(row) + (None,) * (need - len(row))
+        return getter(row)
+    return fields, cols, extract
+
 # ── Validación de coordenadas dentro de Antioquia ────────────────────────────
 # Bounding box amplio para toda el área metropolitana + Rionegro + Caldas
 _LAT_MIN, _LAT_MAX = 5.5, 7.5
@@ -153,8 +237,9 @@ def is_same_unit(o1,o2):
         except: pass
     return False
 def normalize_order(order):
-    # Mapear columnas del Excel al esquema interno primero
-    o = _normalize_col_keys(dict(order))
+    # Mapear columnas al esquema interno primero (las filas "_mapped" ya vienen
+    # en el esquema interno desde compile_header y no repiten el alias)
+    o = dict(order) if order.get("_mapped") else _normalize_col_keys(order)
     o["tecnico"]=norm_text(o.get("tecnico"),"SIN_ASIGNAR") or "SIN_ASIGNAR"
     o["estado"]=norm_text(o.get("estado"),"por programar")
     o["franja"]=norm_franja(o.get("franja"))
@@ -179,10 +264,12 @@ def normalize_order(order):
             o["lat"] = 0.0; o["lon"] = 0.0
     except (ValueError, TypeError):
         o["lat"] = 0.0; o["lon"] = 0.0
-    o["estado_clase"]=classify_status(o["estado"])
-    o["progress"]=get_status_progress(o["estado"])
-    o["effective_weight"]=status_effective_weight(o["estado"])
-    o["completion_credit"]=status_completion_credit(o["estado"])
+    info=status_info(o["estado"])
+    o["estado_clase"]=info.clase
+    o["progress"]=info.progress
+    o["effective_weight"]=info.weight
+    o["completion_credit"]=info.credit
+    o["status_code"]=info.code
     o["addr_key"]=build_address_key(o.get("direccion",""),o["subzona"])
     o["movible"]=o["estado_clase"]=="movible"
     return o
@@ -0,0 +1,295 @@
+"""
+services/recompute_worker.py
+Worker en segundo plano dueño del resultado vigente de nivelación.
+
+Los requests siempre leen el último resultado publicado; los recálculos
+(refresh, upload) se encolan como jobs y corren en un hilo aparte, uno a la
+vez. Mientras hay un job pendiente el resultado vigente se sirve marcado como
+stale, con su edad, en lugar de bloquear el worker HTTP.
+
+Con varios workers de gunicorn, el resultado terminado y el estado de los jobs
+se comparten por services.state_store: cada proceso sirve su copia local y la
+reemplaza cuando otro publica uno más nuevo.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from services.state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+_MAX_JOBS   = 50    # historial de jobs consultables por /api/jobs/<id>
+_JOB_TTL_S  = 900   # un job pendiente más viejo se da por perdido (worker reiniciado)
+_RESULT_KEY = "resultado_vigente"
+_JOBS_KEY   = "recalculos"
+_PENDIENTES = ("en_cola", "ejecutando")
+
+_current = {"result": None, "result_id": None, "version": 0, "modified": None, "shared": 0}
+_jobs    = OrderedDict()   # job_id -> {id, tipo, estado, creado, inicio, fin, error, ...} (de este proceso)
+_pending = []              # job_ids en cola o ejecutando, en orden de llegada
+_queue   = queue.Queue()
+_lock    = threading.Lock()
+_changed = threading.Condition(_lock)   # avisa a wait_change() de un resultado nuevo
+_sync_lock = threading.Lock()
+_SYNC_POLL_S = 1.0   # cada cuánto wait_change() mira si otro worker publicó
+_thread  = {"t": None}
+# Copia parseada de _JOBS_KEY y su versión: se relee solo cuando la versión cambia
+_jobs_cache = {"version": None, "jobs": {}}
+
+
+def _public(job: dict) -> dict:
+    return {k: v for k, v in job.items() if not k.startswith("_")}
+
+
+def _share_job(job: dict) -> None:
+    """Copia el estado del job al almacén compartido (historial acotado)."""
+    def _put(jobs):
+        jobs[job["id"]] = _public(job)
+        viejos = [jid for jid, j in jobs.items() if j["estado"] not in _PENDIENTES]
+        for jid in viejos[:max(0, len(jobs) - _MAX_JOBS)]:
+            del jobs[jid]
+        return jobs
+    try:
+        get_store().update(_JOBS_KEY, _put, {})
+    except Exception as e:
+        logger.warning("No se pudo compartir el job %s: %s", job["id"], e)
+
+
+def _shared_jobs() -> dict:
+    """Jobs compartidos (solo lectura). current() lo llama en cada GET y
+    wait_change() cada segundo por conexión SSE: sin escrituras nuevas basta
+    con mirar la versión."""
+    store = get_store()
+    try:
+        if store.meta(_JOBS_KEY)[0] == _jobs_cache["version"]:
+            return _jobs_cache["jobs"]
+        jobs, version = store.get_versioned(_JOBS_KEY, {})
+    except Exception as e:
+        logger.warning("No se pudo leer el estado de jobs compartido: %s", e)
+        return {}
+    with _lock:
+        if _jobs_cache["version"] is None or version > _jobs_cache["version"]:
+            _jobs_cache["version"], _jobs_cache["jobs"] = version, jobs
+    return jobs
+
+
+def _publish(result, result_id: str) -> None:
+    with _lock:
+        _current["result"]    = result
+        _current["result_id"] = result_id
+        _current["version"]  += 1
+        _current["modified"]  = time.time()
+        _changed.notify_all()
+
+
+def _share_result(result) -> None:
+    """Publica el resultado (ya sin secciones pendientes) para los demás workers."""
+    payload = {"result": result, "id": _current["result_id"], "modified": _current["modified"]}
+    try:
+        version = get_store().set(_RESULT_KEY, payload)
+    except Exception as e:
+        logger.warning("No se pudo compartir el resultado: %s", e)
+        return
+    with _lock:
+        _current["shared"] = max(_current["shared"], version)
+
+
+def _sync_shared() -> None:
+    """Adopta el resultado compartido si otro worker publicó uno más nuevo."""
+    store = get_store()
+    try:
+        if store.meta(_RESULT_KEY)[0] <= _current["shared"]:
+            return
+        with _sync_lock:
+            if store.meta(_RESULT_KEY)[0] <= _current["shared"]:
+                return
+            payload, version = store.get_versioned(_RESULT_KEY, {})
+    except Exception as e:
+        logger.warning("No se pudo leer el resultado compartido: %s", e)
+        return
+    with _lock:
+        _current["shared"] = max(_current["shared"], version)
+        if payload.get("result") is not None and (payload.get("modified") or 0) > (_current["modified"] or 0):
+            _current["result"]    = payload["result"]
+            _current["result_id"] = payload.get("id")
+            _current["version"]  += 1
+            _current["modified"]  = payload["modified"]
+            _changed.notify_all()
+
+
+def _run_job(job_id: str, task, cleanup) -> None:
+    job = _jobs[job_id]
+    job["estado"] = "ejecutando"
+    job["inicio"] = time.time()
+    _share_job(job)
+    try:
+        result = task()
+        _publish(result, job_id)
+        # Publicado: los GET de este proceso ya lo sirven. Las secciones perezosas
+        # (sugerencias, rutas, intercambios) se calculan aquí y no en el hilo de
+        # un request; con el resultado completo se comparte a los demás workers.
+        job["estado"] = "publicado"
+        _share_job(job)
+        for key in getattr(result, "pending", list)():
+            result.get(key)
+        _share_result(result)
+        job["estado"]        = "ok"
+        job["generado_en"]   = result.get("generado_en")
+        job["total_ordenes"] = result.get("resumen", {}).get("total_ordenes", 0)
+    except Exception as e:
+        logger.exception("Error en recálculo %s (%s)", job_id, job["tipo"])
+        job["estado"] = "error"
+        job["error"]  = str(e)
+    finally:
+        if cleanup is not None:
+            try: cleanup()
+            except Exception: pass
+        job["fin"] = time.time()
+        with _lock:
+            _pending.remove(job_id)
+        _share_job(job)
+        job["_done"].set()
+
+
+def _loop() -> None:
+    while True:
+        job_id, task, cleanup = _queue.get()
+        _run_job(job_id, task, cleanup)
+
+
+def _ensure_thread() -> None:
+    with _lock:
+        t = _thread["t"]
+        if t is None or not t.is_alive():
+            t = threading.Thread(target=_loop, name="recompute-worker", daemon=True)
+            _thread["t"] = t
+            t.start()
+
+
+def _waiting() -> list:
+    """job_ids pendientes en cualquier worker, en orden de llegada."""
+    pid = os.getpid()
+    limite = time.time() - _JOB_TTL_S
+    return [
+        jid for jid, j in _shared_jobs().items()
+        if j.get("creado", 0) > limite and (
+            j["estado"] in _PENDIENTES
+            # Publicado en otro worker: aquí sigue vigente el resultado anterior
+            # hasta adoptarlo
+            or (j["estado"] == "publicado" and j.get("worker") != pid
+                and jid != _current["result_id"])
+        )
+    ]
+
+
+def submit(task, tipo: str = "refresh", cleanup=None, coalesce: bool = False) -> str:
+    """
+    Encola task() -> resultado y devuelve el job_id. cleanup() corre al terminar
+    (éxito o error). Con coalesce=True reutiliza un job del mismo tipo que aún
+    no haya empezado, en este o en otro worker: ese job ya leerá los datos más
+    recientes al ejecutarse.
+    """
+    if coalesce:
+        limite = time.time() - _JOB_TTL_S
+        for jid, j in _shared_jobs().items():
+            if j["tipo"] == tipo and j["estado"] == "en_cola" and j.get("creado", 0) > limite:
+                return jid
+    with _lock:
+        if coalesce:
+            for jid in _pending:
+                if _jobs[jid]["tipo"] == tipo and _jobs[jid]["estado"] == "en_cola":
+                    return jid
+        job_id = uuid.uuid4().hex[:12]
+        _jobs[job_id] = {
+            "id": job_id, "tipo": tipo, "estado": "en_cola", "worker": os.getpid(),
+            "creado": time.time(), "inicio": None, "fin": None, "error": None,
+            "_done": threading.Event(),
+        }
+        _pending.append(job_id)
+        for jid in [j for j in _jobs if j not in _pending][:max(0, len(_jobs) - _MAX_JOBS)]:
+            del _jobs[jid]
+    _share_job(_jobs[job_id])
+    _ensure_thread()
+    _queue.put((job_id, task, cleanup))
+    return job_id
+
+
+def wait(job_id: str, timeout: float = None) -> bool:
+    """Espera a que el job termine; False si venció el timeout o no existe."""
+    local = _jobs.get(job_id)
+    if local is not None:
+        return local["_done"].wait(timeout)
+    # Job de otro worker: se consulta el estado compartido
+    limite = None if timeout is None else time.monotonic() + timeout
+    while True:
+        j = _shared_jobs().get(job_id)
+        if j is None or j.get("creado", 0) <= time.time() - _JOB_TTL_S:
+            return False
+        if j["estado"] in ("ok", "error"):
+            return True
+        if limite is not None and time.monotonic() >= limite:
+            return False
+        time.sleep(0.25)
+
+
+def job(job_id: str) -> dict:
+    """Estado público del job, o None si no existe (o ya salió del historial)."""
+    j = _jobs.get(job_id)
+    if j:
+        return _public(j)
+    shared = _shared_jobs().get(job_id)
+    return dict(shared) if shared else None
+
+
+def current() -> dict:
+    """
+    Resultado vigente y sus metadatos: version/modified (ETag, Last-Modified),
+    result_id (job que lo generó; igual en todos los workers), stale (hay un
+    recálculo pendiente), job_id (el último pendiente) y edad_s.
+    """
+    _sync_shared()
+    with _lock:
+        cur = dict(_current)
+    waiting = _waiting()
+    cur["job_id"] = waiting[-1] if waiting else None
+    cur["stale"]  = cur["job_id"] is not None and cur["result"] is not None
+    cur["edad_s"] = round(time.time() - cur["modified"], 1) if cur["modified"] else None
+    return cur
+
+
+def wait_change(version: int, timeout: float) -> dict:
+    """
+    current() en cuanto el resultado vigente deja de ser `version` (publicado
+    aquí o adoptado de otro worker), o al vencer el timeout.
+    """
+    limite = time.monotonic() + timeout
+    while True:
+        cur = current()
+        restante = limite - time.monotonic()
+        if cur["version"] != version or restante <= 0:
+            return cur
+        with _changed:
+            if _current["version"] == version:
+                _changed.wait(min(_SYNC_POLL_S, restante))
+
+
+def ensure(task) -> dict:
+    """
+    current() con un resultado disponible: si todavía no hay ninguno espera
+    el job pendiente más reciente, o encola task() y lo espera.
+    """
+    cur = current()
+    if cur["result"] is not None:
+        return cur
+    job_id = cur["job_id"] or submit(task, "refresh", coalesce=True)
+    wait(job_id)
+    cur = current()
+    if cur["result"] is None:
+        err = (job(job_id) or {}).get("error") or "Sin resultado de nivelación"
+        raise RuntimeError(err)
+    return cur
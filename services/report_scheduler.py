@@ -0,0 +1,130 @@
+"""
+services/report_scheduler.py
+Cortes automáticos del informe diario.
+
+A cada horario (por defecto el inicio de cada franja de config.FRANJAS y un
+corte de cierre al terminar la última) registra un corte con el último
+resultado publicado por services.recompute_worker, sin forzar un recálculo.
+
+Cada worker de gunicorn corre su propio hilo; antes de registrar, el horario
+se reclama en services.state_store y solo el worker que lo obtiene toma el
+corte, así que cada horario se dispara una vez por día.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import (FRANJAS, REPORT_AUTO_CUTS, REPORT_CLOSING_CUT,
+                    REPORT_CUT_GRACE_MINUTES, REPORT_CUT_TIMES)
+from services import snapshot_service as ss
+from services.state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+_CLAIM_KEY = "cortes_programados"   # {"fecha", "horarios": {HH:MM: pid del worker}}
+_TICK_S    = 30                     # cada cuánto se revisa si toca un corte
+
+_hechos  = set()   # (fecha, HH:MM) ya resueltos en este proceso
+_thread  = {"t": None, "pid": None}
+_lock    = threading.Lock()
+
+
+def _hhmm(value: str) -> str:
+    return ss._normalizar_hora_manual(value)[:5]
+
+
+def horarios() -> list:
+    """[(HH:MM, etiqueta)] del día, ordenados."""
+    inicios = REPORT_CUT_TIMES or [f.split("-")[0] for f in FRANJAS]
+    out = {h: f"Corte automatico {h}" for h in map(_hhmm, inicios) if h}
+    if REPORT_CLOSING_CUT.lower() != "none":
+        cierre = _hhmm(REPORT_CLOSING_CUT or max(f.split("-")[-1].strip() for f in FRANJAS))
+        if cierre:
+            out[cierre] = f"Cierre {cierre}"
+    return sorted(out.items())
+
+
+def _ordenes() -> list:
+    """Órdenes del resultado vigente (el último publicado, aunque haya un recálculo pendiente)."""
+    from services import recompute_worker
+    result = recompute_worker.current()["result"] or {}
+    return list(result.get("ordenes_movibles") or []) + list(result.get("ordenes_bloqueadas") or [])
+
+
+def _reclamar(fecha: str, hora: str) -> bool:
+    """True si este worker se queda con el corte de esa hora (atómico entre workers)."""
+    ganado = {"ok": False}
+
+    def _tomar(estado):
+        if not estado or estado.get("fecha") != fecha:
+            estado = {"fecha": fecha, "horarios": {}}
+        if hora not in estado["horarios"]:
+            estado["horarios"][hora] = os.getpid()
+            ganado["ok"] = True
+        return estado
+
+    get_store().update(_CLAIM_KEY, _tomar, {})
+    return ganado["ok"]
+
+
+def _liberar(fecha: str, hora: str) -> None:
+    """Devuelve el horario reclamado para que cualquier worker lo reintente."""
+    def _soltar(estado):
+        if estado and estado.get("fecha") == fecha and estado["horarios"].get(hora) == os.getpid():
+            del estado["horarios"][hora]
+        return estado or {}
+
+    get_store().update(_CLAIM_KEY, _soltar, {})
+
+
+def _tick(now: datetime) -> None:
+    fecha = now.strftime("%Y-%m-%d")
+    ventana = timedelta(minutes=REPORT_CUT_GRACE_MINUTES)
+    for hora, etiqueta in horarios():
+        # Ventana dentro del mismo día: un horario cerca de la medianoche se
+        # dispara hasta las 23:59 (el corte pertenece al informe de ese día)
+        inicio = datetime.combine(now.date(), datetime.strptime(hora, "%H:%M").time())
+        if not inicio <= now < inicio + ventana:
+            continue
+        if (fecha, hora) in _hechos:
+            continue
+        orders = _ordenes()
+        if not orders:
+            continue   # sin resultado todavía: se reintenta hasta vencer la ventana
+        _hechos.add((fecha, hora))
+        if not _reclamar(fecha, hora):
+            continue
+        try:
+            corte = ss.registrar_corte(orders, etiqueta, hora)
+        except Exception:
+            # El horario no se pierde: se libera para reintentarlo en el próximo tick
+            _hechos.discard((fecha, hora))
+            _liberar(fecha, hora)
+            raise
+        logger.info("Corte automatico %s registrado (%s ordenes)", hora, corte["total"])
+
+
+def _loop() -> None:
+    while True:
+        try:
+            _tick(ss._now_naive())
+        except Exception:
+            logger.exception("Error en corte automatico")
+        time.sleep(_TICK_S)
+
+
+def start() -> None:
+    """Arranca el hilo del programador en este proceso (una vez por worker)."""
+    if not REPORT_AUTO_CUTS:
+        return
+    t = _thread["t"]
+    if t is not None and t.is_alive() and _thread["pid"] == os.getpid():
+        return
+    with _lock:
+        t = _thread["t"]
+        if t is None or not t.is_alive() or _thread["pid"] != os.getpid():
+            t = threading.Thread(target=_loop, name="report-scheduler", daemon=True)
+            _thread["t"], _thread["pid"] = t, os.getpid()
+            t.start()
@@ -0,0 +1,99 @@
+"""
+services/result_delta.py
+Diferencias compactas entre dos resultados de nivelación, para /api/stream.
+
+Cada sección con lista se compara por clave (id de orden, técnico, franja,
+orden de la sugerencia...). El delta de una sección es:
+  upsert: [[clave, elemento], ...] nuevos o cambiados, en orden de la lista
+  remove: [clave] que ya no están
+  posiciones: {clave: índice final} de los nuevos, si los que siguen
+          conservan su orden relativo pero los nuevos no van al final
+  orden:  [clave] orden final, si los que siguen cambiaron de orden
+Sin posiciones ni orden: remove, reemplazo en su lugar y nuevos al final.
+Las claves repetidas dentro de una lista se desambiguan con "#n"; el
+dashboard (_keysOf) las calcula igual.
+"""
+import threading
+from collections import OrderedDict
+
+
+def _s(v) -> str:
+    return "" if v is None else str(v)
+
+
+def _alert_key(a: dict) -> str:
+    return "|".join(str(a.get(k) or "") for k in ("tipo", "tecnico", "orden", "franja"))
+
+
+# sección -> clave de cada elemento (mismas reglas que _DELTA_KEYS del dashboard)
+SECTION_KEYS = {
+    "carga_por_franja":   lambda x: _s(x.get("franja")),
+    "carga_por_tecnico":  lambda x: _s(x.get("tecnico")),
+    "ordenes_movibles":   lambda x: _s(x.get("id")),
+    "ordenes_bloqueadas": lambda x: _s(x.get("id")),
+    "alertas":            _alert_key,
+    "sugerencias":        lambda x: _s(x.get("orden")),
+    "intercambios":       lambda x: f'{_s(x.get("orden"))}|{_s(x.get("orden_b"))}',
+}
+
+_MAX_DELTAS = 8      # deltas recientes compartidos entre conexiones SSE
+_deltas = OrderedDict()   # (desde, hasta) -> delta
+_lock = threading.Lock()
+
+
+def _keyed(items: list, key) -> OrderedDict:
+    out, seen = OrderedDict(), {}
+    for x in items or []:
+        k = key(x)
+        n = seen.get(k, 0)
+        seen[k] = n + 1
+        out[k if not n else f"{k}#{n}"] = x
+    return out
+
+
+def diff_section(old: list, new: list, key) -> dict:
+    """Delta de una lista por clave; {} si no cambió."""
+    prev, curr = _keyed(old, key), _keyed(new, key)
+    upsert = [[k, x] for k, x in curr.items() if prev.get(k) != x]
+    remove = [k for k in prev if k not in curr]
+    out = {}
+    if upsert:
+        out["upsert"] = upsert
+    if remove:
+        out["remove"] = remove
+    kept_prev = [k for k in prev if k in curr]
+    kept_curr = [k for k in curr if k in prev]
+    nuevas = {k: i for i, k in enumerate(curr) if k not in prev}
+    if kept_prev != kept_curr:
+        out["orden"] = list(curr)
+    elif nuevas and list(nuevas.values()) != list(range(len(kept_curr), len(curr))):
+        out["posiciones"] = nuevas
+    return out
+
+
+def diff(old, new) -> dict:
+    """Secciones que cambiaron de old a new (resumen va completo si cambió)."""
+    secciones = {}
+    resumen = dict(new.get("resumen") or {})
+    if dict(old.get("resumen") or {}) != resumen:
+        secciones["resumen"] = resumen
+    for section, key in SECTION_KEYS.items():
+        d = diff_section(old.get(section) or [], new.get(section) or [], key)
+        if d:
+            secciones[section] = d
+    return {"generado_en": new.get("generado_en"), "secciones": secciones}
+
+
+def delta(desde: str, old, hasta: str, new) -> dict:
+    """diff() memorizado por par de resultados: lo comparten todas las conexiones."""
+    key = (desde, hasta)
+    with _lock:
+        hit = _deltas.get(key)
+    if hit is not None:
+        return hit
+    out = {"desde": desde, "hasta": hasta, **diff(old, new)}
+    with _lock:
+        _deltas[key] = out
+        while len(_deltas) > _MAX_DELTAS:
+            _deltas.popitem(last=False)
+    return out
@@ -0,0 +1,113 @@
+"""
+services/result_index.py
+Índices sobre el resultado vigente, construidos una vez por resultado (en la
+primera consulta que los necesita):
+- por técnico, zona y franja sobre las listas de órdenes (posiciones dentro
+  de la lista original), para las vistas filtradas y paginadas de
+  /api/nivelacion sin recorrer ni copiar las listas en cada request;
+- por id de acción sobre sugerencias, intercambios y rutas, para
+  /api/sugerencias/accion(es).
+"""
+import threading
+from itertools import chain
+
+ORDER_LISTS = ("ordenes_movibles", "ordenes_bloqueadas")
+INDEXED     = ("tecnico", "zona", "franja")
+
+# tipo de acción -> sección del resultado. Ids: la orden (sugerencia),
+# "INT_<orden>_<orden_b>" (intercambio, igual que el dashboard) y
+# "RUTA_<tecnico>_<zona>" (ruta sugerida)
+ACTION_SECTIONS = {
+    "sugerencia":  "sugerencias",
+    "intercambio": "intercambios",
+    "ruta":        "rutas_sugeridas",
+}
+
+_cache = {"version": None, "idx": {}}   # índices del resultado `version`, por nombre
+_lock  = threading.Lock()
+
+
+def _key(value) -> str:
+    return str(value or "").strip().upper()
+
+
+def _build_orders(result) -> dict:
+    idx = {}
+    for lista in ORDER_LISTS:
+        por_campo = {campo: {} for campo in INDEXED}
+        for pos, o in enumerate(result.get(lista) or []):
+            for campo in INDEXED:
+                por_campo[campo].setdefault(_key(o.get(campo)), []).append(pos)
+        idx[lista] = por_campo
+    return idx
+
+
+def _index(version, name: str, build):
+    with _lock:
+        if _cache["version"] == version and name in _cache["idx"]:
+            return _cache["idx"][name]
+    # Fuera del lock: puede forzar una sección perezosa del resultado
+    idx = build()
+    with _lock:
+        if _cache["version"] is None or version > _cache["version"]:
+            _cache["idx"] = {}
+            _cache["version"] = version
+        elif version < _cache["version"]:
+            return idx   # request de un resultado ya reemplazado: no se cachea
+        return _cache["idx"].setdefault(name, idx)
+
+
+def action_id(tipo: str, item: dict) -> str:
+    if tipo == "intercambio":
+        return f'INT_{item.get("orden")}_{item.get("orden_b")}'
+    if tipo == "ruta":
+        return f'RUTA_{item.get("tecnico_sugerido")}_{item.get("zona")}'
+    return str(item.get("orden"))
+
+
+def action_type(accion_id: str) -> str:
+    if accion_id.startswith("INT_"):
+        return "intercambio"
+    if accion_id.startswith("RUTA_"):
+        return "ruta"
+    return "sugerencia"
+
+
+def find_action(result, version, accion_id: str):
+    """(tipo, elemento) de la sugerencia/intercambio/ruta con ese id, o (tipo, None)."""
+    tipo = action_type(accion_id)
+    section = ACTION_SECTIONS[tipo]
+    por_id = _index(version, section, lambda: {
+        action_id(tipo, item): item for item in result.get(section) or []
+    })
+    return tipo, por_id.get(accion_id)
+
+
+def query(result, version, lista: str, filtros: dict = None, offset: int = 0,
+          limit: int = None, fields: list = None) -> tuple:
+    """
+    (filas, total) de una lista de órdenes.
+
+    filtros: {campo: [valores]} con campo en INDEXED; dentro de un campo los
+             valores se unen (OR), entre campos se intersectan (AND). Sin
+             distinguir mayúsculas.
+    offset/limit: página sobre el total filtrado.
+    fields: proyección; solo esos campos de cada orden (None = todos).
+    """
+    orders = result.get(lista) or []
+    if filtros:
+        por_campo = _index(version, "ordenes", lambda: _build_orders(result))[lista]
+        candidatos = sorted(
+            (sorted(set(chain.from_iterable(por_campo[campo].get(_key(v), ()) for v in valores)))
+             for campo, valores in filtros.items()),
+            key=len,
+        )
+        resto = [set(p) for p in candidatos[1:]]
+        posiciones = [p for p in candidatos[0] if all(p in r for r in resto)]
+    else:
+        posiciones = range(len(orders))
+
+    pagina = posiciones[offset:None if limit is None else offset + limit]
+    if fields:
+        return [{f: orders[p].get(f) for f in fields} for p in pagina], len(posiciones)
+    return [orders[p] for p in pagina], len(posiciones)
@@ -11,22 +11,56 @@ Reglas:
 - Si una franja/tipo baja de cantidad y no hay canceladas que expliquen la baja,
   la diferencia se marca como reprogramada para el resumen operativo.
 - La lista de ordenes reprogramadas solo incluye ordenes que desaparecen del corte y no quedan explicadas por canceladas.
+- Al cerrar el dia sus cortes pasan al archivo (comprimidos, con agregados por
+  franja y tipo) para consultar tendencias entre dias; el informe interactivo
+  sigue siendo solo el del dia actual.
 """
+import base64
 import io
 import json
 import logging
 import os
 import tempfile
-from datetime import datetime
+import threading
+import time
+import zlib
+from bisect import insort
+from datetime import datetime, timedelta
+
+from services.state_store import get_store
 
 logger = logging.getLogger(__name__)
 
+# Cortes del día en services.state_store, compartidos por todos los workers.
+# La clave _REPORT_KEY es un índice chico ({"fecha", "cortes", "agregados",
+# "normalizado"}) con los datos de cada corte sin el estado por orden; el
+# _order_state de cada corte se escribe una sola vez en su propio segmento
+# ("reporte_diario/<id del corte>") y solo se vuelve a leer el del último,
+# para compararlo con el siguiente. Los cortes se guardan ya normalizados y
+# comparados con el anterior; "agregados" lleva el resumen ejecutivo y la
+# lista consolidada de reprogramadas al día, así que leer el informe no
+# recorre los cortes. _store es la copia local del índice; _store_meta guarda
+# la versión del almacén que refleja (se recarga cuando otro worker escribe),
+# los agregados y los cortes públicos de esa versión.
+_REPORT_KEY = "reporte_diario"
 _store: dict = {}
+_store_meta = {"version": 0, "modified": time.time(), "agregados": None, "publicos": []}
+# Archivo de días cerrados: _ARCHIVE_KEY es el índice {fecha: agregados del
+# día} que responde las consultas por rango; el día completo (cortes públicos,
+# sin estado por orden) queda comprimido en "reporte_archivo/<fecha>".
+_ARCHIVE_KEY = "reporte_archivo"
+# Excel del informe, por store_version(): se arma de nuevo solo tras un corte
+_excel_cache = {"clave": None, "data": b""}
+_excel_lock = threading.Lock()
+# Archivo del formato anterior: si existe se migra una vez al almacén compartido
 _STORE_FILE = os.environ.get(
     "REPORT_SNAPSHOT_FILE",
     os.path.join(tempfile.gettempdir(), "nivelacion_pro_reporte_hoy.json"),
 )
 
+# Campos del estado por orden de cada corte (ver _estado_columnar)
+_COLUMNAS = ("estado", "grupo", "franja", "tipo", "tecnico")
+
 _GRUPOS = {
     "Programadas": {"programado", "programada"},
     "Por Programar": {"por programar"},
@@ -155,16 +189,13 @@ def _normalizar_snapshot_tipos(corte: dict) -> dict:
             _merge_key_stats(fr_data.setdefault(grupo, _empty_key_stats()), stats or {})
     corte["por_franja_tipo"] = {f: dict(sorted(t.items())) for f, t in sorted(nuevo_ft.items())}
 
-    # order_state interno para comparaciones entre fotos.
+    # order_state interno para comparaciones entre fotos: basta con normalizar
+    # las tablas de franja y tipo.
     if "_order_state" in corte:
-        for _oid, state in (corte.get("_order_state") or {}).items():
-            if not isinstance(state, dict):
-                continue
-            franja = _norm_franja(state.get("franja"))
-            tipo = _norm_tipo(state.get("tipo"))
-            state["franja"] = franja
-            state["tipo"] = tipo
-            state["key"] = f"{franja}||{tipo}"
+        state = _columnar(corte.get("_order_state"))
+        state["tablas"]["franja"] = [_norm_franja(v) for v in state["tablas"]["franja"]]
+        state["tablas"]["tipo"] = [_norm_tipo(v) for v in state["tablas"]["tipo"]]
+        corte["_order_state"] = state
 
     # detalle y diferencias que vengan de cortes viejos tambien deben verse agrupados.
     for d in corte.get("detalle_cambios", []) or []:
@@ -229,48 +260,250 @@ def _hora_label(dt: datetime) -> str:
     return f"Cierre {dt.strftime('%H:%M:%S')}"
 
 
-def _purge_old_days() -> None:
+def _reprog_key(x: dict) -> tuple:
+    fr = x.get("franja") or "Sin Franja"
+    return (fr == "Sin Franja", fr, x.get("hora", ""), x.get("orden", ""))
+
+
+def _agregados_vacios() -> dict:
+    return {"inicio": None, "final": None, "cancelados": 0, "reprogramados": 0, "reprogramadas": []}
+
+
+def _sumar_corte(agregados: dict, corte: dict, vistas: set) -> None:
+    """Suma un corte (ya comparado con el anterior) a los agregados del dia.
+
+    vistas son las ordenes que ya estan en la lista consolidada: una orden
+    reprogramada queda con la hora del primer corte en que salio.
+    """
+    punto = {
+        "appointments": int(corte.get("vigentes", corte.get("total", 0)) or 0),
+        "hora": corte.get("hora", ""),
+    }
+    if agregados["inicio"] is None:
+        agregados["inicio"] = punto
+    agregados["final"] = punto
+    agregados["cancelados"] += int(corte.get("canceladas_nuevas", 0) or 0)
+    agregados["reprogramados"] += int(corte.get("reprogramadas", 0) or 0)
+    for item in corte.get("ordenes_reprogramadas", []) or []:
+        orden = str(item.get("orden", "")).strip()
+        if not orden or orden in vistas:
+            continue
+        vistas.add(orden)
+        insort(agregados["reprogramadas"], {
+            "hora": corte.get("hora", ""),
+            "orden": orden,
+            "franja_antes": item.get("franja_antes", ""),
+            "franja_despues": item.get("franja_despues", "No aparece en el corte"),
+            "franja": item.get("franja", item.get("franja_antes", "Sin Franja")),
+        }, key=_reprog_key)
+
+
+def _agregar_dia(cortes: list) -> dict:
+    agregados, vistas = _agregados_vacios(), set()
+    for corte in cortes:
+        _sumar_corte(agregados, corte, vistas)
+    return agregados
+
+
+def _dia_normalizado(payload: dict, fecha: str) -> tuple:
+    """(cortes, agregados) del payload guardado, normalizando una sola vez el formato anterior."""
+    if (payload or {}).get("fecha") != fecha:
+        return [], _agregados_vacios()
+    cortes = list(payload.get("cortes") or [])
+    if payload.get("normalizado") and payload.get("agregados"):
+        return cortes, payload["agregados"]
+    # Reporte guardado antes de normalizar al escribir (tipos crudos como
+    # Add: Extension, Add: Router, Traslado, o sin agregados)
+    cortes = _recalcular_diferencias_dia(cortes)
+    return cortes, _agregar_dia(cortes)
+
+
+def _segmento(corte: dict) -> str:
+    return f"{_REPORT_KEY}/{corte['id']}"
+
+
+def _estado_corte(corte: dict) -> dict:
+    """_order_state de un corte: el de su segmento o, en el formato anterior, el que trae adentro."""
+    if "_order_state" in corte:
+        return corte["_order_state"] or {}
+    return get_store().get(corte["_segmento"], {}) if corte.get("_segmento") else {}
+
+
+def _separar_estado(corte: dict) -> dict:
+    """Registro del índice para el corte: su _order_state pasa a su segmento."""
+    estado = corte.pop("_order_state", None)
+    if estado is not None:
+        corte["_segmento"] = _segmento(corte)
+        get_store().set(corte["_segmento"], estado)
+    return corte
+
+
+def _borrar_segmentos(cortes) -> None:
+    for corte in cortes or []:
+        if isinstance(corte, dict) and corte.get("_segmento"):
+            get_store().delete(corte["_segmento"])
+
+
+def _set_local(fecha: str, cortes: list, agregados: dict, version: int) -> None:
     global _store
+    _store = {fecha: cortes}
+    _store_meta["version"] = version
+    _store_meta["agregados"] = agregados
+    _store_meta["publicos"] = [_public(c) for c in cortes]
+
+
+def _purge_old_days() -> None:
     hoy = _today()
     if _store and set(_store.keys()) != {hoy}:
-        _store = {hoy: _store.get(hoy, [])}
+        # Versión -1: el siguiente _load_store relee el índice y archiva el día cerrado
+        _set_local(hoy, [], _agregados_vacios(), -1)
+
+
+def _agregado_archivo(cortes: list, agregados: dict) -> dict:
+    """Totales de un día cerrado, por franja y tipo, para las consultas por rango.
+
+    cancelados / reprogramados son los del resumen ejecutivo (conteos entre
+    cortes del total del día). El desglose por franja/tipo mide otra cosa y
+    no tiene por qué sumar lo mismo, por eso lleva otros nombres:
+    - canceladas_detectadas: aumento de canceladas de cada franja/tipo entre
+      cortes consecutivos (una baja en otra celda no lo compensa);
+    - ordenes_reprogramadas: ordenes de la lista consolidada (una vez cada
+      una, hasta 500 por corte) con la franja y el tipo que tenian antes de
+      salir; las bajas sin orden identificable no aparecen.
+    El día trae tambien la suma de cada medida del desglose.
+    """
+    por_ft = {}
+
+    def _celda(franja, tipo):
+        return por_ft.setdefault(f"{franja}||{tipo}", {
+            "franja": franja, "tipo": tipo, "canceladas_detectadas": 0, "ordenes_reprogramadas": 0,
+        })
+
+    anterior, vistas = None, set()
+    for corte in cortes:
+        actual = _flatten_franja_tipo(corte)
+        if anterior is not None:
+            for key, data in actual.items():
+                subio = data["canceladas"] - (anterior.get(key) or {}).get("canceladas", 0)
+                if subio > 0:
+                    _celda(data["franja"], data["tipo"])["canceladas_detectadas"] += subio
+        for item in corte.get("ordenes_reprogramadas", []) or []:
+            orden = str(item.get("orden", "")).strip()
+            if not orden or orden in vistas:
+                continue
+            vistas.add(orden)
+            _celda(item.get("franja") or "Sin Franja", _norm_tipo(item.get("tipo")))["ordenes_reprogramadas"] += 1
+        anterior = actual
+
+    inicio, final = agregados.get("inicio") or {}, agregados.get("final") or {}
+    return {
+        "cortes": len(cortes),
+        "hora_inicio": inicio.get("hora", ""),
+        "hora_final": final.get("hora", ""),
+        "appointments_inicio": inicio.get("appointments", 0),
+        "appointments_final": final.get("appointments", 0),
+        "cancelados": agregados.get("cancelados", 0),
+        "reprogramados": agregados.get("reprogramados", 0),
+        "canceladas_detectadas": sum(x["canceladas_detectadas"] for x in por_ft.values()),
+        "ordenes_reprogramadas": sum(x["ordenes_reprogramadas"] for x in por_ft.values()),
+        "por_franja_tipo": sorted(
+            por_ft.values(),
+            key=lambda x: (x["franja"] == "Sin Franja", x["franja"], x["tipo"]),
+        ),
+    }
+
+
+def _archivar_dia(payload: dict) -> None:
+    """Pasa el día del payload al archivo y borra los segmentos de sus cortes.
+
+    Corre dentro de la transacción que reemplaza el índice del informe, así
+    que un día se archiva una sola vez aunque varios workers lo intenten.
+    """
+    fecha = (payload or {}).get("fecha")
+    cortes, agregados = _dia_normalizado(payload, fecha)
+    if fecha and cortes:
+        store = get_store()
+        dia = {"fecha": fecha, "cortes": [_public(c) for c in cortes], "agregados": agregados}
+        store.set(f"{_ARCHIVE_KEY}/{fecha}", base64.b64encode(zlib.compress(
+            json.dumps(dia, ensure_ascii=False, default=str).encode("utf-8"), 6)).decode("ascii"))
+        from config import REPORT_ARCHIVE_DAYS
+        limite = (datetime.strptime(fecha, "%Y-%m-%d") - timedelta(days=REPORT_ARCHIVE_DAYS)).strftime("%Y-%m-%d")
+
+        def _indexar(indice):
+            indice[fecha] = _agregado_archivo(cortes, agregados)
+            for vieja in [f for f in indice if f <= limite]:
+                del indice[vieja]
+                store.delete(f"{_ARCHIVE_KEY}/{vieja}")
+            return indice
+
+        store.update(_ARCHIVE_KEY, _indexar, {})
+        logger.info("Informe del %s archivado (%s cortes)", fecha, len(cortes))
+    _borrar_segmentos((payload or {}).get("cortes"))
+
+
+def _cerrar_dia(payload: dict) -> dict:
+    """fn de update(): archiva el día guardado si ya no es hoy y deja el informe de hoy vacío."""
+    hoy = _today()
+    if (payload or {}).get("fecha") in (None, hoy):
+        return payload or {}
+    _archivar_dia(payload)
+    return {"fecha": hoy, "cortes": [], "agregados": _agregados_vacios(), "normalizado": True}
+
+
+def _migrar_archivo() -> None:
+    """Lleva el reporte del día desde el archivo JSON anterior al almacén compartido."""
     try:
-        if os.path.exists(_STORE_FILE):
-            with open(_STORE_FILE, "r", encoding="utf-8") as fh:
-                payload = json.load(fh)
-            if payload.get("fecha") != hoy:
-                os.remove(_STORE_FILE)
+        if not os.path.exists(_STORE_FILE):
+            return
+        with open(_STORE_FILE, "r", encoding="utf-8") as fh:
+            payload = json.load(fh)
+        if payload.get("fecha") == _today() and payload.get("cortes"):
+            get_store().update(_REPORT_KEY, lambda actual: actual or payload)
+        os.remove(_STORE_FILE)
     except Exception as exc:
-        logger.warning("No se pudo depurar reporte diario: %s", exc)
+        logger.warning("No se pudo migrar reporte diario: %s", exc)
 
 
 def _load_store() -> None:
-    global _store
     hoy = _today()
     _purge_old_days()
-    if _store.get(hoy):
-        return
     try:
-        if not os.path.exists(_STORE_FILE):
-            _store.setdefault(hoy, [])
+        version, _ = get_store().meta(_REPORT_KEY)
+        if version == _store_meta["version"] and hoy in _store:
             return
-        with open(_STORE_FILE, "r", encoding="utf-8") as fh:
-            payload = json.load(fh)
-        cortes = payload.get("cortes", []) or [] if payload.get("fecha") == hoy else []
-        _store = {hoy: _recalcular_diferencias_dia(cortes)}
-        _save_store()
+        if version == 0:
+            _migrar_archivo()
+        payload, version = get_store().get_versioned(_REPORT_KEY, {})
+        if payload.get("fecha") not in (None, hoy) and payload.get("cortes"):
+            payload, version = get_store().update(_REPORT_KEY, _cerrar_dia, {})
+        _set_local(hoy, *_dia_normalizado(payload, hoy), version)
     except Exception as exc:
         logger.warning("No se pudo cargar reporte diario: %s", exc)
-        _store.setdefault(hoy, [])
+        if hoy not in _store:
+            _set_local(hoy, [], _agregados_vacios(), _store_meta["version"])
+
+
+def store_version() -> tuple:
+    """(versión, día) del informe vigente: cambia con cada corte, reset o cambio de día."""
+    return (get_store().meta(_REPORT_KEY)[0], _today())
+
 
+def store_modified() -> float:
+    return get_store().meta(_REPORT_KEY)[1] or _store_meta["modified"]
 
-def _save_store() -> None:
+
+def _vaciar_store() -> None:
     hoy = _today()
-    os.makedirs(os.path.dirname(_STORE_FILE), exist_ok=True)
-    tmp = f"{_STORE_FILE}.tmp"
-    with open(tmp, "w", encoding="utf-8") as fh:
-        json.dump({"fecha": hoy, "cortes": _store.get(hoy, [])}, fh, ensure_ascii=False)
-    os.replace(tmp, _STORE_FILE)
+
+    def _vaciar(payload):
+        if (payload or {}).get("fecha") == hoy:
+            _borrar_segmentos(payload.get("cortes"))
+        else:
+            _archivar_dia(payload)
+        return {"fecha": hoy, "cortes": [], "agregados": _agregados_vacios(), "normalizado": True}
+
+    payload, version = get_store().update(_REPORT_KEY, _vaciar, {})
+    _set_local(hoy, [], payload["agregados"], version)
 
 
 def _order_id(order: dict, pos: int) -> str:
@@ -287,13 +520,44 @@ def _empty_key_stats() -> dict:
     }
 
 
+def _estado_columnar(filas: dict) -> dict:
+    """_order_state en columnas: ids ordenados y, por campo, el código de su valor en tablas[campo].
+
+    filas es {oid: (estado, grupo, franja, tipo, tecnico)}. Cada valor distinto
+    (técnico, franja, tipo...) se guarda una sola vez en su tabla.
+    """
+    ids = sorted(filas)
+    tablas = {c: [] for c in _COLUMNAS}
+    codigos = {c: {} for c in _COLUMNAS}
+    columnas = {c: [] for c in _COLUMNAS}
+    for oid in ids:
+        for campo, valor in zip(_COLUMNAS, filas[oid]):
+            code = codigos[campo].get(valor)
+            if code is None:
+                code = codigos[campo][valor] = len(tablas[campo])
+                tablas[campo].append(valor)
+            columnas[campo].append(code)
+    return {"ids": ids, **columnas, "tablas": tablas}
+
+
+def _columnar(state) -> dict:
+    """_order_state en columnas; convierte el formato anterior {oid: {campo: valor}}."""
+    state = state or {}
+    if isinstance(state.get("ids"), list) and isinstance(state.get("tablas"), dict):
+        return state
+    return _estado_columnar({
+        str(oid): tuple(v.get(c) for c in _COLUMNAS)
+        for oid, v in state.items() if isinstance(v, dict)
+    })
+
+
 def _clasificar(orders: list) -> dict:
     por_estado = {g: 0 for g in _GRUPOS}
     por_estado.setdefault("Otros", 0)
     por_franja: dict = {}
     por_tipo: dict = {}
     por_franja_tipo: dict = {}
-    order_state: dict = {}
+    filas: dict = {}
 
     for pos, o in enumerate(orders or []):
         if not isinstance(o, dict):
@@ -319,18 +583,12 @@ def _clasificar(orders: list) -> dict:
         else:
             key_data["vigentes"] += 1
 
-        order_state[oid] = {
-            "estado": estado_norm,
-            "grupo": grupo,
-            "franja": franja,
-            "tipo": tipo,
-            "key": f"{franja}||{tipo}",
-            "tecnico": tecnico,
-        }
+        filas[oid] = (estado_norm, grupo, franja, tipo, tecnico)
 
+    order_state = _estado_columnar(filas)
     return {
-        "total": len(order_state),
-        "vigentes": sum(1 for o in order_state.values() if o.get("grupo") != "Canceladas"),
+        "total": len(filas),
+        "vigentes": sum(1 for fila in filas.values() if fila[1] != "Canceladas"),
         "por_estado": por_estado,
         "por_franja": dict(sorted(por_franja.items())),
         "por_tipo": dict(sorted(por_tipo.items())),
@@ -377,31 +635,46 @@ def _comparar(anterior: dict, actual: dict) -> None:
     - Si la baja esta explicada por nuevas canceladas del corte, no se cuenta como reprogramada.
     - La lista solo muestra numeros de orden que salieron y no fueron explicados por canceladas.
     """
-    prev = anterior.get("_order_state", {}) or {}
-    curr = actual.get("_order_state", {}) or {}
-    prev_ids = set(prev.keys())
-    curr_ids = set(curr.keys())
-
-    salieron = sorted(prev_ids - curr_ids)
-    nuevas = sorted(curr_ids - prev_ids)
-    comunes = sorted(prev_ids & curr_ids)
+    prev = _columnar(anterior.get("_order_state"))
+    curr = _columnar(actual.get("_order_state"))
+    prev_ids, curr_ids = prev["ids"], curr["ids"]
+    p_grupo, p_franja, p_tipo = prev["grupo"], prev["franja"], prev["tipo"]
+    c_grupo, c_franja, c_tipo = curr["grupo"], curr["franja"], curr["tipo"]
+    pt, ct = prev["tablas"], curr["tablas"]
 
     cambios_estado = 0
     cambios_franja = 0
     cambios_tipo = 0
     common_became_cancelled = 0
 
-    for oid in comunes:
-        p = prev.get(oid) or {}
-        c = curr.get(oid) or {}
-        if p.get("grupo") != c.get("grupo"):
-            cambios_estado += 1
-        if p.get("franja") != c.get("franja"):
-            cambios_franja += 1
-        if p.get("tipo") != c.get("tipo"):
-            cambios_tipo += 1
-        if c.get("grupo") == "Canceladas" and p.get("grupo") != "Canceladas":
-            common_became_cancelled += 1
+    # Recorrido conjunto de los dos ids ordenados: salieron (posiciones en
+    # prev), nuevas y comunes en una sola pasada
+    salieron = []
+    nuevas = 0
+    i = j = 0
+    n_prev, n_curr = len(prev_ids), len(curr_ids)
+    while i < n_prev and j < n_curr:
+        a, b = prev_ids[i], curr_ids[j]
+        if a == b:
+            g_antes, g_ahora = pt["grupo"][p_grupo[i]], ct["grupo"][c_grupo[j]]
+            if g_antes != g_ahora:
+                cambios_estado += 1
+                if g_ahora == "Canceladas":
+                    common_became_cancelled += 1
+            if pt["franja"][p_franja[i]] != ct["franja"][c_franja[j]]:
+                cambios_franja += 1
+            if pt["tipo"][p_tipo[i]] != ct["tipo"][c_tipo[j]]:
+                cambios_tipo += 1
+            i += 1
+            j += 1
+        elif a < b:
+            salieron.append(i)
+            i += 1
+        else:
+            nuevas += 1
+            j += 1
+    salieron.extend(range(i, n_prev))
+    nuevas += n_curr - j
 
     prev_vigentes = int(anterior.get("vigentes", anterior.get("total", 0)) or 0)
     curr_vigentes = int(actual.get("vigentes", actual.get("total", 0)) or 0)
@@ -416,13 +689,12 @@ def _comparar(anterior: dict, actual: dict) -> None:
 
     # Lista de ordenes: solo ordenes que desaparecieron del corte. No se listan modificaciones.
     # Si hubo canceladas nuevas, se usan para explicar primero parte de las salidas.
+    def _franja_prev(pos):
+        return pt["franja"][p_franja[pos]] or "Sin Franja"
+
     salieron_ordenados = sorted(
         salieron,
-        key=lambda oid: (
-            (prev.get(oid) or {}).get("franja", "Sin Franja") == "Sin Franja",
-            (prev.get(oid) or {}).get("franja", "Sin Franja"),
-            str(oid),
-        ),
+        key=lambda pos: (_franja_prev(pos) == "Sin Franja", _franja_prev(pos), prev_ids[pos]),
     )
     omitidas_por_cancelacion = min(len(salieron_ordenados), canceladas_nuevas)
     candidatos_reprogramados = salieron_ordenados[omitidas_por_cancelacion:]
@@ -432,18 +704,17 @@ def _comparar(anterior: dict, actual: dict) -> None:
         candidatos_reprogramados = []
 
     ordenes_reprogramadas = []
-    for oid in candidatos_reprogramados:
-        p = prev.get(oid) or {}
+    for pos in candidatos_reprogramados:
         ordenes_reprogramadas.append({
-            "orden": str(oid),
-            "franja": p.get("franja") or "Sin Franja",
-            "franja_antes": p.get("franja") or "Sin Franja",
+            "orden": prev_ids[pos],
+            "franja": _franja_prev(pos),
+            "franja_antes": _franja_prev(pos),
             "franja_despues": "No aparece en el corte",
-            "tipo": p.get("tipo") or "",
+            "tipo": pt["tipo"][p_tipo[pos]] or "",
         })
 
     actual["salieron"] = len(salieron)
-    actual["nuevas"] = subieron_vigentes if subieron_vigentes else len(nuevas)
+    actual["nuevas"] = subieron_vigentes if subieron_vigentes else nuevas
     actual["reprogramadas"] = reprogramadas_total
     actual["cambios_estado"] = cambios_estado
     actual["cambios_franja"] = cambios_franja
@@ -454,28 +725,10 @@ def _comparar(anterior: dict, actual: dict) -> None:
     actual["diferencias_franja_tipo"] = []
 
 
-def registrar_corte(orders: list, label: str = None, hora_manual: str = None) -> dict:
-    _load_store()
-    now = _now_naive()
-    fecha = now.strftime("%Y-%m-%d")
-    hora_exacta = now.strftime("%H:%M:%S")
-    hora_operativa = _normalizar_hora_manual(hora_manual) or hora_exacta
-    etiqueta = label or f"Corte {hora_operativa}"
-
-    stats = _clasificar(orders)
-    stats["fecha"] = fecha
-    stats["hora"] = hora_exacta
-    stats["hora_exacta"] = hora_exacta
-    stats["label"] = etiqueta
-    dia = _store.setdefault(fecha, [])
-    if dia:
-        # Por compatibilidad, normaliza cortes anteriores que hayan quedado con tipos crudos
-        # como Add: Extension, Add: Router, Traslado, etc.
-        dia[:] = _recalcular_diferencias_dia(dia)
-        _comparar(dia[-1], stats)
-
-    corte = {
-        "id": f"{fecha}_{hora_exacta}_{len(dia) + 1}",
+def _nuevo_corte(stats: dict, now: datetime, fecha: str, hora_exacta: str,
+                 hora_operativa: str, etiqueta: str, numero: int) -> dict:
+    return {
+        "id": f"{fecha}_{hora_exacta}_{numero}",
         "label": etiqueta,
         "fecha": fecha,
         "hora": hora_operativa,
@@ -501,8 +754,43 @@ def registrar_corte(orders: list, label: str = None, hora_manual: str = None) ->
         "diferencias_franja_tipo": stats["diferencias_franja_tipo"],
         "_order_state": stats["_order_state"],
     }
-    dia.append(corte)
-    _save_store()
+
+
+def registrar_corte(orders: list, label: str = None, hora_manual: str = None) -> dict:
+    _load_store()
+    now = _now_naive()
+    fecha = now.strftime("%Y-%m-%d")
+    hora_exacta = now.strftime("%H:%M:%S")
+    hora_operativa = _normalizar_hora_manual(hora_manual) or hora_exacta
+    etiqueta = label or f"Corte {hora_operativa}"
+
+    stats = _clasificar(orders)
+    stats["fecha"] = fecha
+    stats["hora"] = hora_exacta
+    stats["hora_exacta"] = hora_exacta
+    stats["label"] = etiqueta
+
+    def _agregar(payload):
+        # Dentro de la transacción del almacén: el corte se compara con el
+        # último registrado por cualquier worker. Solo el corte nuevo se
+        # normaliza y se compara; los anteriores ya se guardaron así. Los
+        # segmentos se escriben y borran en esta misma transacción.
+        dia, agregados = _dia_normalizado(payload, fecha)
+        if dia:
+            _comparar({**dia[-1], "_order_state": _estado_corte(dia[-1])}, stats)
+        else:
+            _archivar_dia(payload)   # cortes de otro día
+        corte = _normalizar_snapshot_tipos(
+            _nuevo_corte(stats, now, fecha, hora_exacta, hora_operativa, etiqueta, len(dia) + 1))
+        dia.append(corte)
+        _sumar_corte(agregados, corte, {r["orden"] for r in agregados["reprogramadas"]})
+        # Solo el corte nuevo (y, una vez, los del formato anterior) trae _order_state
+        dia = [_separar_estado(c) for c in dia]
+        return {"fecha": fecha, "cortes": dia, "agregados": agregados, "normalizado": True}
+
+    payload, version = get_store().update(_REPORT_KEY, _agregar, {})
+    _set_local(fecha, payload["cortes"], payload["agregados"], version)
+    corte = payload["cortes"][-1]
     logger.info(
         "Corte %s %s | total=%s vigentes=%s cancel=%s reprog=%s",
         fecha, hora_exacta, corte["total"], corte["vigentes"],
@@ -520,9 +808,7 @@ def get_cortes(fecha: str = None) -> list:
     hoy = _today()
     if fecha and fecha != hoy:
         return []
-    cortes = _recalcular_diferencias_dia(_store.get(hoy, []))
-    _store[hoy] = cortes
-    return [_public(c) for c in cortes]
+    return list(_store_meta["publicos"])
 
 
 def get_fechas() -> list:
@@ -546,10 +832,11 @@ def get_resumen_ejecutivo(fecha: str = None) -> dict:
     """Resumen liviano del informe diario.
 
     Usa el primer y ultimo corte del dia actual. Las canceladas y reprogramadas
-    son la suma detectada entre cortes.
+    son la suma detectada entre cortes (agregados que se actualizan con cada corte).
     """
-    cortes = get_cortes(fecha)
-    if not cortes:
+    _load_store()
+    agregados = _store_meta["agregados"] or _agregados_vacios()
+    if (fecha and fecha != _today()) or agregados["inicio"] is None:
         return {
             "appointments_inicio": 0,
             "appointments_final": 0,
@@ -558,15 +845,13 @@ def get_resumen_ejecutivo(fecha: str = None) -> dict:
             "hora_inicio": "",
             "hora_final": "",
         }
-    primero = cortes[0]
-    ultimo = cortes[-1]
     return {
-        "appointments_inicio": int(primero.get("vigentes", primero.get("total", 0)) or 0),
-        "appointments_final": int(ultimo.get("vigentes", ultimo.get("total", 0)) or 0),
-        "cancelados": sum(int(c.get("canceladas_nuevas", 0) or 0) for c in cortes),
-        "reprogramados": sum(int(c.get("reprogramadas", 0) or 0) for c in cortes),
-        "hora_inicio": primero.get("hora", ""),
-        "hora_final": ultimo.get("hora", ""),
+        "appointments_inicio": agregados["inicio"]["appointments"],
+        "appointments_final": agregados["final"]["appointments"],
+        "cancelados": agregados["cancelados"],
+        "reprogramados": agregados["reprogramados"],
+        "hora_inicio": agregados["inicio"]["hora"],
+        "hora_final": agregados["final"]["hora"],
     }
 
 
@@ -575,150 +860,190 @@ def get_ordenes_reprogramadas_consolidadas(fecha: str = None) -> list:
 
     Solo incluye ordenes que estaban en el corte anterior y ya no aparecen en el siguiente,
     descontando las bajas explicadas por canceladas. No incluye modificaciones de estado/tipo.
+    Se mantiene ordenada al registrar cada corte.
     """
-    cortes = get_cortes(fecha)
-    out = []
-    seen = set()
-    for c in cortes:
-        for item in c.get("ordenes_reprogramadas", []) or []:
-            orden = str(item.get("orden", "")).strip()
-            if not orden or orden in seen:
-                continue
-            seen.add(orden)
-            out.append({
-                "hora": c.get("hora", ""),
-                "orden": orden,
-                "franja_antes": item.get("franja_antes", ""),
-                "franja_despues": item.get("franja_despues", "No aparece en el corte"),
-                "franja": item.get("franja", item.get("franja_antes", "Sin Franja")),
+    _load_store()
+    if fecha and fecha != _today():
+        return []
+    return list((_store_meta["agregados"] or _agregados_vacios())["reprogramadas"])
+
+
+def archivo_version() -> tuple:
+    """(versión, epoch) del índice del archivo; antes archiva el día anterior si falta."""
+    _load_store()
+    return get_store().meta(_ARCHIVE_KEY)
+
+
+def get_rango(desde: str, hasta: str) -> dict:
+    """Días archivados entre desde y hasta (inclusive, YYYY-MM-DD) y sus totales.
+
+    Sale solo del índice de agregados: no descomprime días ni lee estado por
+    orden. Cada medida se suma por separado (ver _agregado_archivo).
+    """
+    indice = get_store().get(_ARCHIVE_KEY, {}) or {}
+    dias = [{"fecha": f, **indice[f]} for f in sorted(indice) if desde <= f <= hasta]
+    por_ft = {}
+    for dia in dias:
+        for x in dia["por_franja_tipo"]:
+            acc = por_ft.setdefault((x["franja"], x["tipo"]), {
+                "franja": x["franja"], "tipo": x["tipo"], "canceladas_detectadas": 0, "ordenes_reprogramadas": 0,
             })
-    def _key(x):
-        fr = x.get("franja") or "Sin Franja"
-        return (fr == "Sin Franja", fr, x.get("hora", ""), x.get("orden", ""))
-    return sorted(out, key=_key)
+            acc["canceladas_detectadas"] += x["canceladas_detectadas"]
+            acc["ordenes_reprogramadas"] += x["ordenes_reprogramadas"]
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "dias": dias,
+        "totales": {
+            "dias": len(dias),
+            "cancelados": sum(d["cancelados"] for d in dias),
+            "reprogramados": sum(d["reprogramados"] for d in dias),
+            "canceladas_detectadas": sum(d["canceladas_detectadas"] for d in dias),
+            "ordenes_reprogramadas": sum(d["ordenes_reprogramadas"] for d in dias),
+            "por_franja_tipo": sorted(
+                por_ft.values(),
+                key=lambda x: (x["franja"] == "Sin Franja", x["franja"], x["tipo"]),
+            ),
+        },
+    }
 
 
 def reset_reporte_diario() -> bool:
     """Borra manualmente los cortes del dia actual para iniciar limpio el informe."""
     _load_store()
-    hoy = _today()
-    _store[hoy] = []
-    try:
-        if os.path.exists(_STORE_FILE):
-            os.remove(_STORE_FILE)
-    except Exception as exc:
-        logger.warning("No se pudo eliminar archivo de reporte diario: %s", exc)
+    _vaciar_store()
     return True
 
 
+def _anchos(filas: list, max_width: int) -> list:
+    """Ancho de cada columna según el texto más largo (mismo criterio que el autoajuste anterior)."""
+    n = max((len(f) for f in filas), default=0)
+    return [
+        min(max_width, max(10, max(len(str(f[col] or "")) if col < len(f) else 0 for f in filas) + 2))
+        for col in range(n)
+    ]
+
+
 def generar_excel(fecha: str = None) -> bytes:
+    """Excel del informe del dia. Se arma una vez por version del informe y se
+    reutiliza hasta el siguiente corte (o reset / cambio de dia)."""
+    hoy = _today()
+    if fecha and fecha != hoy:
+        raise ValueError("El reporte solicitado ya vencio. Solo se puede descargar el informe del dia actual.")
+    clave = store_version()
+    with _excel_lock:
+        if _excel_cache["clave"] != clave:
+            _excel_cache["data"] = _construir_excel(hoy)
+            _excel_cache["clave"] = clave
+        return _excel_cache["data"]
+
+
+def _construir_excel(fecha: str) -> bytes:
     try:
         from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
         from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
         from openpyxl.utils import get_column_letter
     except ImportError:
         raise RuntimeError("openpyxl no instalado")
 
-    hoy = _today()
-    if fecha and fecha != hoy:
-        raise ValueError("El reporte solicitado ya vencio. Solo se puede descargar el informe del dia actual.")
-    fecha = hoy
     cortes = get_cortes(fecha)
     resumen = get_resumen_ejecutivo(fecha)
     reprogramadas = get_ordenes_reprogramadas_consolidadas(fecha)
 
-    wb = Workbook()
-
-    def font(bold=False, color="000000", size=10):
-        return Font(bold=bold, color=color, size=size)
-
-    def fill(color):
-        return PatternFill("solid", fgColor=color)
+    # write_only: las filas van directo al archivo; estilos y anchos se
+    # definen antes de escribir (los anchos se calculan sobre los valores)
+    wb = Workbook(write_only=True)
 
     center = Alignment(horizontal="center", vertical="center", wrap_text=True)
     left = Alignment(horizontal="left", vertical="center", wrap_text=True)
     thin = Border(left=Side(style="thin"), right=Side(style="thin"), top=Side(style="thin"), bottom=Side(style="thin"))
     hdr = "1F3864"
     title = "D6E4F0"
-
-    def style_header(row):
-        for cell in row:
-            cell.font = font(True, "FFFFFF")
-            cell.fill = fill(hdr)
+    header_font = Font(bold=True, color="FFFFFF", size=10)
+    header_fill = PatternFill("solid", fgColor=hdr)
+
+    def hoja(nombre, filas, estilo, max_width=32, freeze=None, merge=None):
+        ws = wb.create_sheet(nombre)
+        for col, width in enumerate(_anchos(filas, max_width), 1):
+            ws.column_dimensions[get_column_letter(col)].width = width
+        if freeze:
+            ws.freeze_panes = freeze
+        if merge:
+            ws.merged_cells.add(merge)
+        for n, fila in enumerate(filas, 1):
+            celdas = []
+            for col, value in enumerate(fila, 1):
+                cell = WriteOnlyCell(ws, value=value)
+                estilo(cell, n, col)
+                celdas.append(cell)
+            ws.append(celdas)
+
+    def header(cell):
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = center
+        cell.border = thin
+
+    def estilo_resumen(cell, n, col):
+        if n == 1 and col == 1:
+            cell.font = Font(bold=True, color=hdr, size=13)
+            cell.fill = PatternFill("solid", fgColor=title)
             cell.alignment = center
+        elif n == 3:
+            header(cell)
+        elif n >= 4:
             cell.border = thin
-
-    def autosize(ws, max_width=32):
-        for col in ws.columns:
-            letter = get_column_letter(col[0].column)
-            width = min(max_width, max(10, max(len(str(c.value or "")) for c in col) + 2))
-            ws.column_dimensions[letter].width = width
-
-    ws = wb.active
-    ws.title = "Resumen Ejecutivo"
-    ws.append([f"Reporte diario de seguimiento operativo - {fecha}"])
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=4)
-    ws["A1"].font = font(True, hdr, 13)
-    ws["A1"].fill = fill(title)
-    ws["A1"].alignment = center
-    ws.append([])
-    ws.append(["Concepto", "Valor"])
-    style_header(ws[3])
-    rows = [
-        ("Hora primer corte", resumen.get("hora_inicio", "")),
-        ("Hora ultimo corte", resumen.get("hora_final", "")),
-        ("Appointments inicio del corte", resumen.get("appointments_inicio", 0)),
-        ("Appointments final del corte", resumen.get("appointments_final", 0)),
-        ("Total appointments cancelados", resumen.get("cancelados", 0)),
-        ("Total appointments reprogramados", resumen.get("reprogramados", 0)),
+            cell.alignment = left if col == 1 else center
+
+    # Las filas de datos ocupan las 4 columnas del titulo combinado
+    resumen_filas = [
+        [f"Reporte diario de seguimiento operativo - {fecha}", None, None, None],
+        [],
+        ["Concepto", "Valor", None, None],
+        ["Hora primer corte", resumen.get("hora_inicio", ""), None, None],
+        ["Hora ultimo corte", resumen.get("hora_final", ""), None, None],
+        ["Appointments inicio del corte", resumen.get("appointments_inicio", 0), None, None],
+        ["Appointments final del corte", resumen.get("appointments_final", 0), None, None],
+        ["Total appointments cancelados", resumen.get("cancelados", 0), None, None],
+        ["Total appointments reprogramados", resumen.get("reprogramados", 0), None, None],
     ]
-    for row in rows:
-        ws.append(list(row))
-    for row in ws.iter_rows(min_row=4):
-        for cell in row:
-            cell.border = thin
-            cell.alignment = left if cell.column == 1 else center
-    autosize(ws, 45)
-    ws.freeze_panes = "A4"
-
-    ws2 = wb.create_sheet("Cortes del Dia")
-    ws2.append(["Hora corte", "Hora captura real", "Appointments vigentes", "Instalacion", "Soporte", "Otros Tipos", "Canceladas acumuladas", "Reprogramados del corte"])
-    style_header(ws2[1])
+    hoja("Resumen Ejecutivo", resumen_filas, estilo_resumen, 45, freeze="A4", merge="A1:D1")
+
+    def estilo_tabla(izquierda=()):
+        def estilo(cell, n, col):
+            if n == 1:
+                header(cell)
+            else:
+                cell.border = thin
+                cell.alignment = left if col in izquierda else center
+        return estilo
+
+    cortes_filas = [["Hora corte", "Hora captura real", "Appointments vigentes", "Instalacion", "Soporte", "Otros Tipos", "Canceladas acumuladas", "Reprogramados del corte"]]
     for c in cortes:
         por_tipo = c.get("por_tipo") or {}
-        ws2.append([
+        cortes_filas.append([
             c.get("hora"), c.get("hora_captura") or c.get("hora_exacta") or c.get("hora"),
             c.get("vigentes", c.get("total", 0)),
             por_tipo.get("Instalacion", 0), por_tipo.get("Soporte", 0), por_tipo.get("Otros Tipos", 0),
             (c.get("por_estado") or {}).get("Canceladas", 0), c.get("reprogramadas", 0),
         ])
-    for row in ws2.iter_rows(min_row=2):
-        for cell in row:
-            cell.border = thin
-            cell.alignment = center
-    autosize(ws2)
-    ws2.freeze_panes = "A2"
+    hoja("Cortes del Dia", cortes_filas, estilo_tabla(), freeze="A2")
 
-    ws3 = wb.create_sheet("Reprogramadas")
-    ws3.append(["Franja", "Orden", "Observacion", "Hora detectada"])
-    style_header(ws3[1])
+    reprog_filas = [["Franja", "Orden", "Observacion", "Hora detectada"]]
     for item in reprogramadas:
-        ws3.append([item.get("franja"), item.get("orden"), item.get("franja_despues") or "No aparece en el corte", item.get("hora")])
-    for row in ws3.iter_rows(min_row=2):
-        for cell in row:
-            cell.border = thin
-            cell.alignment = left if cell.column in (1, 2, 3) else center
-    autosize(ws3)
-    ws3.freeze_panes = "A2"
-
-    ws4 = wb.create_sheet("Notas")
-    ws4.append(["Regla aplicada"])
-    ws4.append(["El reporte solo corresponde al dia actual. Al cambiar el dia, el reporte anterior vence y no queda disponible para descarga."])
-    ws4.append(["El resumen ejecutivo compara el primer corte contra el ultimo corte disponible del dia."])
-    ws4.append(["Las canceladas se calculan entre cortes. Si baja la cantidad de appointments vigentes y la baja no esta explicada por canceladas, se toma como reprogramacion operativa."])
-    ws4.append(["La lista Reprogramadas solo muestra ordenes que estaban en el corte anterior y no aparecen en el siguiente corte, despues de descontar canceladas. No incluye modificaciones de estado/tipo."])
-    ws4.append(["Para reducir el tamaño, los tipos se agrupan en Instalacion, Soporte y Otros Tipos."])
-    autosize(ws4, 90)
+        reprog_filas.append([item.get("franja"), item.get("orden"), item.get("franja_despues") or "No aparece en el corte", item.get("hora")])
+    hoja("Reprogramadas", reprog_filas, estilo_tabla((1, 2, 3)), freeze="A2")
+
+    notas = [
+        ["Regla aplicada"],
+        ["El reporte solo corresponde al dia actual. Al cambiar el dia, el reporte anterior vence y no queda disponible para descarga."],
+        ["El resumen ejecutivo compara el primer corte contra el ultimo corte disponible del dia."],
+        ["Las canceladas se calculan entre cortes. Si baja la cantidad de appointments vigentes y la baja no esta explicada por canceladas, se toma como reprogramacion operativa."],
+        ["La lista Reprogramadas solo muestra ordenes que estaban en el corte anterior y no aparecen en el siguiente corte, despues de descontar canceladas. No incluye modificaciones de estado/tipo."],
+        ["Para reducir el tamaño, los tipos se agrupan en Instalacion, Soporte y Otros Tipos."],
+    ]
+    hoja("Notas", notas, lambda cell, n, col: None, 90)
 
     bio = io.BytesIO()
     wb.save(bio)
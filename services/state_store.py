@@ -0,0 +1,163 @@
+"""
+services/state_store.py
+Estado compartido entre workers y hilos de gunicorn: acciones sobre
+sugerencias, lista negra, reporte diario, último resultado publicado y jobs
+de recálculo.
+
+Backends (STATE_BACKEND):
+  sqlite (default) - archivo SQLite en modo WAL (STATE_DB_PATH). Varios
+                     procesos leen y escriben el mismo archivo con
+                     transacciones cortas.
+  memory           - dict del proceso (un solo worker o pruebas).
+
+Cada clave guarda un valor JSON y una versión que sube con cada escritura;
+update() hace lectura-modificación-escritura atómica y devuelve
+(valor nuevo, versión nueva). Las escrituras hechas desde el fn de un
+update() (set, update, delete de otras claves) entran en la misma
+transacción.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config import STATE_BACKEND, STATE_DB_PATH
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class MemoryStore:
+    """Backend en memoria: mismo contrato que SqliteStore, sin compartir entre procesos."""
+
+    def __init__(self):
+        self._data = {}            # key -> (json, version, updated)
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        return self.get_versioned(key, default)[0]
+
+    def get_versioned(self, key, default=None) -> tuple:
+        with self._lock:
+            row = self._data.get(key)
+        return (json.loads(row[0]), row[1]) if row else (default, 0)
+
+    def meta(self, key) -> tuple:
+        """(versión, epoch de la última escritura); (0, None) si la clave no existe."""
+        with self._lock:
+            row = self._data.get(key)
+        return (row[1], row[2]) if row else (0, None)
+
+    def update(self, key, fn, default=None) -> tuple:
+        with self._lock:
+            old, version = self.get_versioned(key, default)
+            new = fn(old)
+            self._data[key] = (_dumps(new), version + 1, time.time())
+            return new, version + 1
+
+    def set(self, key, value) -> int:
+        return self.update(key, lambda _old: value)[1]
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SqliteStore:
+    """Backend SQLite (WAL): una conexión por hilo y por proceso."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " version INTEGER NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # Conexiones nuevas tras un fork de gunicorn: nunca se heredan del master
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        """Transacción de escritura; dentro de otra (update anidado) se suma a ella."""
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, key, default=None):
+        return self.get_versioned(key, default)[0]
+
+    def get_versioned(self, key, default=None) -> tuple:
+        row = self._conn().execute(
+            "SELECT value, version FROM kv WHERE key = ?", (key,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (default, 0)
+
+    def meta(self, key) -> tuple:
+        """(versión, epoch de la última escritura); (0, None) si la clave no existe."""
+        row = self._conn().execute(
+            "SELECT version, updated FROM kv WHERE key = ?", (key,)).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def update(self, key, fn, default=None) -> tuple:
+        with self._tx() as conn:
+            row = conn.execute(
+                "SELECT value, version FROM kv WHERE key = ?", (key,)).fetchone()
+            new = fn(json.loads(row[0]) if row else default)
+            version = (row[1] if row else 0) + 1
+            conn.execute(
+                "INSERT INTO kv (key, value, version, updated) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value,"
+                " version = excluded.version, updated = excluded.updated",
+                (key, _dumps(new), version, time.time()),
+            )
+        return new, version
+
+    def set(self, key, value) -> int:
+        # Sin leer ni parsear el valor anterior (puede ser el resultado completo)
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT INTO kv (key, value, version, updated) VALUES (?, ?, 1, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value,"
+                " version = kv.version + 1, updated = excluded.updated",
+                (key, _dumps(value), time.time()),
+            )
+            return conn.execute(
+                "SELECT version FROM kv WHERE key = ?", (key,)).fetchone()[0]
+
+    def delete(self, key) -> None:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+
+_store = {"backend": None}
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Backend configurado (se crea en el primer uso, ya dentro del worker)."""
+    if _store["backend"] is None:
+        with _store_lock:
+            if _store["backend"] is None:
+                _store["backend"] = (MemoryStore() if STATE_BACKEND == "memory"
+                                     else SqliteStore(STATE_DB_PATH))
+    return _store["backend"]
@@ -0,0 +1,74 @@
+"""
+Regresión: LazyResult leído desde varios hilos mientras otro resuelve sus
+secciones pendientes (lo que hace recompute_worker tras publicar).
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.leveling_engine import LazyResult
+
+SECCIONES = [f"seccion_{i}" for i in range(200)]
+
+
+def _seccion(k):
+    time.sleep(0)   # cede el GIL como un cálculo real
+    return [k]
+
+
+def _resultado():
+    return LazyResult({"resumen": {"total": 1}}, {k: (lambda k=k: _seccion(k)) for k in SECCIONES})
+
+
+def test_keys_consistentes_mientras_se_resuelve():
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        _carrera()
+    finally:
+        sys.setswitchinterval(intervalo)
+
+
+def _carrera():
+    esperadas = {"resumen", *SECCIONES}
+    errores = []
+    for _ in range(30):
+        result = _resultado()
+        inicio = threading.Barrier(5)
+
+        def lector():
+            inicio.wait()
+            try:
+                for _ in range(50):
+                    if set(result.keys()) != esperadas or len(result) != len(esperadas):
+                        errores.append("faltan claves")
+                    result.cheap(SECCIONES)
+                    result.pending()
+                    "seccion_0" in result
+            except Exception as e:   # "dictionary changed size during iteration"
+                errores.append(repr(e))
+
+        def resolver():
+            inicio.wait()
+            for key in result.pending():
+                result.get(key)
+
+        hilos = [threading.Thread(target=lector) for _ in range(4)] + [threading.Thread(target=resolver)]
+        for t in hilos:
+            t.start()
+        for t in hilos:
+            t.join()
+        assert result.pending() == []
+    assert not errores, errores[:5]
+
+
+def test_cheap_no_calcula_lo_omitido():
+    calls = []
+    result = LazyResult({"a": 1}, {"b": lambda: calls.append("b") or 2})
+    assert result.cheap(["b"]) == {"a": 1, "b": None}
+    assert calls == []
+    assert dict(result.items()) == {"a": 1, "b": 2}
+    assert result.pending() == []